@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Apache Arrow input and output.
+
+compute_arrow takes a pyarrow.Table and compute_arrow_batches an iterable of record batches (a
+RecordBatchReader, an IPC stream, Parquet row groups, ...) with the parameter file columns (SL_N0, SYMBOL,
+LOT_SIZE, NO_OF_LOTS, TOTAL_LOT_SIZE, BUY_VALUE, SELL_VALUE) and return the report columns as Arrow with
+typed columns: the charges and BROKERAGE % are float64 (BROKERAGE % is the number, not the "0.123%" string of
+the Excel report) and SL_N0, SYMBOL, NO_OF_LOTS and TOTAL_LOT_SIZE are passed through with their input types.
+
+In local and calibrated mode the numeric columns are read as NumPy views of the Arrow buffers and the results
+are wrapped back without copies or pandas; batches are computed one at a time as they arrive, so a stream is
+processed with a few batches in memory. Scrape and verify mode go through BrokerageCalculator.compute one batch
+at a time, and every batch still gets the same columns and types: scraped amounts are parsed into float64, and
+a row whose scrape failed is kept with null charges. Verify mode also adds VERIFY_STATUS and VERIFY_MAX_DIFF and
+verifies a sample of each batch, not one sample of the whole input, since the batches of a stream are not known
+up front. Rows with a null LOT_SIZE, NO_OF_LOTS, BUY_VALUE or SELL_VALUE are dropped and counted as failed.
+
+    python arrow_io.py trades.arrow results.arrow --segment options --mode local
+    producer | python arrow_io.py - - --segment futures --mode local | consumer      # IPC streams on stdin/stdout
+"""
+import os
+import sys
+import argparse
+
+from brokerage_calculator import CALCULATION_MODES, BrokerageCalculator
+from charge_engine import compute_charges_arrays
+from fee_schedule import SEGMENTS, clean_value
+
+# Columns that must be present and non-null for a row to be computed
+NUMERIC_COLUMNS = ('LOT_SIZE', 'NO_OF_LOTS', 'BUY_VALUE', 'SELL_VALUE')
+
+# Charge columns of every results batch, in compute_charges order; all float64
+CHARGE_COLUMNS = ["BROKERAGE", "STT_TOTAL", "EXCHANGE_TXN_Charge", "GST", "SEBI_CHARGES", "STAMP DUTY",
+                  "TOTAL TAX AND CHARGES", "POINTS TO BREAKEVEN", "TOTAL BROKERAGE", "BROKERAGE %"]
+
+
+def record_batches(data):
+    """The record batches of a Table, a single RecordBatch, or an iterable of batches (e.g. a RecordBatchReader)"""
+    import pyarrow as pa
+
+    if isinstance(data, pa.Table):
+        return data.to_batches()
+    if isinstance(data, pa.RecordBatch):
+        return [data]
+    if isinstance(data, pa.ipc.RecordBatchFileReader):
+        # The random-access file reader does not iterate; read its batches one by one
+        return (data.get_batch(index) for index in range(data.num_record_batches))
+    return data
+
+
+def _numbers(batch, column, arrow_type):
+    # Zero-copy NumPy view when the column already has the type; otherwise one cast
+    values = batch.column(column)
+    if values.type != arrow_type:
+        import pyarrow.compute as pc
+        values = pc.cast(values, arrow_type, safe=False)
+    return values.to_numpy(zero_copy_only=False)
+
+
+def _trade_columns(batch):
+    """(report columns taken from the input, total lot sizes, buy values, sell values) of a batch"""
+    import pyarrow as pa
+
+    lot_size = _numbers(batch, 'LOT_SIZE', pa.int64())
+    no_of_lots = _numbers(batch, 'NO_OF_LOTS', pa.int64())
+    buy_value = _numbers(batch, 'BUY_VALUE', pa.float64())
+    sell_value = _numbers(batch, 'SELL_VALUE', pa.float64())
+    total_lot_size = lot_size * no_of_lots
+
+    premium = buy_value + sell_value
+    columns = {
+        'SL_N0': batch.column('SL_N0'),
+        'SYMBOLS': batch.column('SYMBOL'),
+        'LOT_SIZE': pa.array(lot_size),
+        "PREMUIM_VALUE": pa.array(premium),
+        'NO_OF_LOTS': batch.column('NO_OF_LOTS'),
+        'TOTAL_LOT_SIZE': (batch.column('TOTAL_LOT_SIZE') if 'TOTAL_LOT_SIZE' in batch.schema.names
+                           else pa.array(total_lot_size)),
+        'TOTAL_PREMIUM_VALUE': pa.array(premium * total_lot_size),
+    }
+    return columns, total_lot_size, buy_value, sell_value
+
+
+def _compute_batch_local(schedule, batch):
+    import pyarrow as pa
+
+    columns, total_lot_size, buy_value, sell_value = _trade_columns(batch)
+    charges = compute_charges_arrays(schedule, total_lot_size, buy_value, sell_value)
+    for key in CHARGE_COLUMNS:
+        columns[key] = pa.array(charges[key])
+    return pa.RecordBatch.from_arrays(list(columns.values()), names=list(columns))
+
+
+def _amount(value):
+    # A scraped amount ("1,234.00", "0.123%") or a number as a float; NaN when missing or unreadable
+    try:
+        return clean_value(str(value).rstrip('%')) if value is not None else float('nan')
+    except ValueError:
+        return float('nan')
+
+
+def _compute_batch_rows(calculator, batch):
+    """
+    A batch through BrokerageCalculator.compute (scrape and verify mode), with the columns and types of
+    _compute_batch_local in input order; rows that could not be computed get null charges
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    columns, _, _, _ = _trade_columns(batch)
+    df = batch.to_pandas()
+    # compute returns the computed rows sorted by SL_N0; numbering the rows by position puts them back in
+    # input order, duplicate SL_N0 values included
+    df['SL_N0'] = np.arange(len(df))
+    results_df = calculator.compute(df)
+    positions = results_df['SL_N0'].to_numpy(dtype=np.int64)
+
+    def amounts(key):
+        # Null where the row was not computed; with no row computed results_df has no charge columns at all
+        values = np.full(len(df), np.nan)
+        if len(results_df):
+            values[positions] = [_amount(value) for value in results_df[key].tolist()]
+        return pa.array(values, from_pandas=True)
+
+    for key in CHARGE_COLUMNS:
+        columns[key] = amounts(key)
+    if calculator.mode == 'verify':
+        status = np.full(len(df), None, dtype=object)
+        if len(results_df):
+            status[positions] = results_df['VERIFY_STATUS'].tolist()
+        columns['VERIFY_STATUS'] = pa.array(status, type=pa.string())
+        columns['VERIFY_MAX_DIFF'] = amounts('VERIFY_MAX_DIFF')
+    return pa.RecordBatch.from_arrays(list(columns.values()), names=list(columns)), len(results_df)
+
+
+def compute_arrow_batches(calculator, batches, progress=None):
+    """
+    Yield one results RecordBatch per input batch, in input order, as the batches arrive.
+    calculator.stats covers all batches once the generator is exhausted (in verify mode with the verification
+    counts summed over the batch samples); progress(done) gets the rows done so far.
+    """
+    import pyarrow.compute as pc
+
+    stats = {'rows': 0, 'computed': 0, 'failed': 0}
+    verification = {'sampled': 0, 'compared': 0, 'scrape_failures': 0, 'mismatches': 0}
+    for batch in record_batches(batches):
+        stats['rows'] += batch.num_rows
+        valid = None
+        for column in NUMERIC_COLUMNS:
+            column_valid = pc.is_valid(batch.column(column))
+            valid = column_valid if valid is None else pc.and_(valid, column_valid)
+        if batch.num_rows and not pc.all(valid).as_py():
+            batch = batch.filter(valid)
+
+        if calculator.mode in ('local', 'calibrated'):
+            results = _compute_batch_local(calculator.schedule, batch)
+            stats['computed'] += results.num_rows
+        else:
+            results, computed = _compute_batch_rows(calculator, batch)
+            stats['computed'] += computed
+            if calculator.mode == 'verify':
+                for key in verification:
+                    verification[key] += calculator.stats['verification'][key]
+                stats['verification'] = dict(verification)
+        stats['failed'] = stats['rows'] - stats['computed']
+        calculator.stats = dict(stats)
+        if progress:
+            progress(stats['rows'])
+        yield results
+
+
+def compute_arrow(calculator, table):
+    """Results of a pyarrow.Table as a pyarrow.Table sorted by SL_N0, like BrokerageCalculator.compute"""
+    import pyarrow as pa
+
+    table = table.sort_by('SL_N0')
+    batches = list(compute_arrow_batches(calculator, table))
+    if not batches:
+        return pa.table({})
+    return pa.Table.from_batches(batches)
+
+
+def open_batches(path):
+    """Record batches of an Arrow IPC file or stream, or a Parquet file read row group by row group; - is stdin"""
+    import pyarrow as pa
+
+    if path == '-':
+        return pa.ipc.open_stream(sys.stdin.buffer)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).iter_batches()
+    try:
+        return pa.ipc.open_file(path)
+    except pa.ArrowInvalid:
+        return pa.ipc.open_stream(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute brokerage for Arrow record batches")
+    parser.add_argument("input", help="Arrow IPC file or stream, Parquet file, or - for an IPC stream on stdin")
+    parser.add_argument("output", help="Arrow IPC stream to write, or - for stdout")
+    parser.add_argument("--segment", choices=SEGMENTS, default="options")
+    parser.add_argument("--mode", choices=CALCULATION_MODES, default=os.environ.get("BROKERAGE_MODE", "local"))
+    args = parser.parse_args()
+
+    import pyarrow as pa
+
+    calculator = BrokerageCalculator(args.segment, args.mode)
+    results = compute_arrow_batches(calculator, open_batches(args.input))
+    sink = sys.stdout.buffer if args.output == '-' else args.output
+    writer = None
+    try:
+        for batch in results:
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    # Progress goes to stderr so stdout can carry the stream
+    print(f"Computed {calculator.stats.get('computed', 0)} of {calculator.stats.get('rows', 0)} rows",
+          file=sys.stderr)
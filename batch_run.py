@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Process every *_input.xlsx/.xls/.csv file in a directory in one run.
+
+All rows of all files share one calculator and, when scraping, one adaptive worker pool with the files' rows
+interleaved, so the run takes about total rows / pool throughput instead of the sum of separate runs. Each file
+gets its own parameter file and report; OUTPUT/BATCH_INDEX{timestamp}.xlsx lists them all.
+
+    python batch_run.py [DIRECTORY] --segment options --mode scrape
+    python batch_run.py [DIRECTORY] --segment options --mode local --backend polars
+"""
+import os
+import argparse
+
+from brokerage_calculator import BACKENDS, CALCULATION_MODES, base_dir, find_input_files, process_input_files
+from fee_schedule import SEGMENTS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process all input files in a directory with one shared pool")
+    parser.add_argument("directory", nargs="?", default=base_dir())
+    parser.add_argument("--segment", choices=SEGMENTS, default="options")
+    parser.add_argument("--mode", choices=CALCULATION_MODES, default=os.environ.get("BROKERAGE_MODE", "scrape"))
+    parser.add_argument("--backend", choices=BACKENDS, default=os.environ.get("BROKERAGE_BACKEND", "pandas"),
+                        help="polars runs local and calibrated mode as one parallel Polars query")
+    args = parser.parse_args()
+
+    input_files = find_input_files(args.directory)
+    if not input_files:
+        print("No input files found")
+    else:
+        def report_progress(done, total_rows):
+            print(f"Processing: {done / total_rows * 100:.1f}%", end="\r")
+
+        process_input_files(input_files, args.segment, args.mode, progress=report_progress,
+                            backend=args.backend)
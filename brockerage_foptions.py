@@ -1,25 +1,28 @@
 import math
-import pandas as pd
-import time
-from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-import tkinter as tk
-from tkinter import ttk, messagebox
-from tkinter import filedialog
 import os
 import platform
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from scrape_fixtures import FixtureMiss, scrape_with_fixtures
+from brokerage_calculator import find_input_files, process_input_file
 
-def calculate_brokerage(lot_size, total_lot_size, buy_value, sell_value):
+# Calculator segment scraped by this script, used to look up its fee schedule
+SEGMENT = "options"
+
+# Page scraped by scrape_calculator; point BROKERAGE_CALCULATOR_URL at calculator_server.py to work offline
+CALCULATOR_URL = os.environ.get("BROKERAGE_CALCULATOR_URL", "https://zerodha.com/brokerage-calculator/#tab-equities")
+
+
+def scrape_calculator(total_lot_size, buy_value, sell_value):
     """
-    Calculate brokerage and other charges based on input values.
-    This is a simplified calculation based on Zerodha's fee structure.
+    Enter one trade into the calculator page and return its eight result values as displayed (innerHTML).
     """
+    # Selenium is only needed when the page is actually driven; importing it costs ~0.3s of start-up
+    from selenium import webdriver
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.by import By
+
     driver = None
     try:
         options = webdriver.ChromeOptions()
@@ -29,17 +32,12 @@ def calculate_brokerage(lot_size, total_lot_size, buy_value, sell_value):
         options.add_argument("--disable-dev-shm-usage")
         driver = webdriver.Chrome(options=options)
 
-        url = "https://zerodha.com/brokerage-calculator/#tab-equities"
+        url = CALCULATOR_URL
         driver.get(url)
 
         # Wait for elements and scrape values
         WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "opt_brokerage")))
 
-        # Calculate turnover
-        buy_turnover = buy_value * total_lot_size
-        sell_turnover = sell_value * total_lot_size
-        total_turnover = buy_turnover + sell_turnover
-
         # Enter values in the calculator fields
         buy_price_input = driver.find_element(By.CLASS_NAME, "opt_bp")
         sell_price_input = driver.find_element(By.CLASS_NAME, "opt_sp")
@@ -78,6 +76,26 @@ def calculate_brokerage(lot_size, total_lot_size, buy_value, sell_value):
         # Break even points (total charges / total quantity)
         break_even = driver.execute_script('return document.querySelector("#opt_breakeven").innerHTML')
 
+        return brokerage, stt, etc, gst, sebi, stamp, total, break_even
+
+    finally:
+        if driver:
+            try:
+                driver.quit()
+            except Exception as e:
+                print(f"Error closing WebDriver: {str(e)}")
+
+
+def calculate_brokerage(lot_size, total_lot_size, buy_value, sell_value):
+    """
+    Calculate brokerage and other charges based on input values.
+    This is a simplified calculation based on Zerodha's fee structure.
+    """
+    try:
+        # Scrape the calculator, or record/replay its response depending on BROKERAGE_SCRAPE_MODE
+        brokerage, stt, etc, gst, sebi, stamp, total, break_even = scrape_with_fixtures(
+            SEGMENT, scrape_calculator, total_lot_size, buy_value, sell_value)
+
         # Calculate total turnover for percentage calculation
         total_turnover = (buy_value + sell_value) * total_lot_size
 
@@ -122,6 +140,8 @@ def calculate_brokerage(lot_size, total_lot_size, buy_value, sell_value):
 
         return result
 
+    except FixtureMiss:
+        raise
     except Exception as e:
         import traceback
         error_line = traceback.extract_tb(e.__traceback__)[-1].lineno
@@ -129,137 +149,25 @@ def calculate_brokerage(lot_size, total_lot_size, buy_value, sell_value):
         print("Full stack trace:")
         print(traceback.format_exc())
 
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except Exception as e:
-                print(f"Error closing WebDriver: {str(e)}")
 
+def process_excel_file(input_file, progress_bar, progress_label, root_window, controller=None, mode="scrape",
+                       verify_sample_size=20, verify_strategy="stratified", incremental=False, sheets=None,
+                       stream_output=None, backend="pandas", partition=None):
+    def update_progress(done, total_rows):
+        progress = (done / total_rows) * 100
+        progress_bar['value'] = progress
+        progress_label.config(text=f"Processing: {progress:.1f}%")
+        root_window.update()
 
-def process_excel_file(input_file, progress_bar, progress_label, root_window):
     try:
-        # Read the input Excel file
-        # Check if INPUT directory exists, create it if it doesn't
-        input_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "INPUT")
-        if not os.path.exists(input_dir):
-            os.makedirs(input_dir)
-            print(f"Created input directory: {input_dir}")
-        
-        # Create a copy of the input file with timestamp in INPUT directory
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        input_filename = os.path.basename(input_file)
-        input_basename, input_ext = os.path.splitext(input_filename)
-        input_copy_path = os.path.join(input_dir, f"{input_basename}_{timestamp}{input_ext}")
-        
-        # Copy the file
-        if input_file != input_copy_path:  # Avoid copying if already in the right place
-            with open(input_file, 'rb') as src_file:
-                with open(input_copy_path, 'wb') as dst_file:
-                    dst_file.write(src_file.read())
-            print(f"Copied input file to: {input_copy_path}")
-
-        # Now process the file
-        if input_file.lower().endswith('.csv'):
-            df = pd.read_csv(input_file)
-        else:  # Excel file
-            df = pd.read_excel(input_file)
-
-        # Create lists to store the scraped data
-        brokerage_data = []
-        total_rows = len(df)
-
-        print(f"Processing {total_rows} rows from {input_file}")
-        symbol = df.iloc[0]['SYMBOL'] if 'SYMBOL' in df.columns else "UNKNOWN"
-        parameter_output = f"{symbol}_parameter.xlsx"
-
-        # Copy the required columns to the first output file
-        parameter_df = df[
-            ['SL_N0', 'SYMBOL', 'LOT_SIZE', 'NO_OF_LOTS', 'TOTAL_LOT_SIZE', 'BUY_VALUE', 'SELL_VALUE']].copy()
-        parameter_df.to_excel(parameter_output, index=False)
-        print(f"Parameter file saved to {parameter_output}")
-
-        # Process each row
-        # Define a function to process a single row
-        def process_row(row_data):
-            lot_size = int(row_data['LOT_SIZE'])
-            no_of_lots = int(row_data['NO_OF_LOTS'])
-
-            # Get brokerage calculations
-            buy_value = float(row_data['BUY_VALUE'])
-            sell_value = float(row_data['SELL_VALUE'])
-            calculated_values = calculate_brokerage(lot_size, lot_size * no_of_lots, buy_value, sell_value)
-            buy_turnover = (buy_value + sell_value) * no_of_lots * lot_size
-
-            # Prepare row data
-            result_row = {
-                'SL_N0': row_data['SL_N0'],
-                'SYMBOLS': row_data['SYMBOL'],
-                'LOT_SIZE': lot_size,
-                "PREMUIM_VALUE": buy_value + sell_value,
-                'NO_OF_LOTS': row_data['NO_OF_LOTS'],
-                'TOTAL_LOT_SIZE': row_data['TOTAL_LOT_SIZE'],
-                'TOTAL_PREMIUM_VALUE': buy_turnover,
-            }
-
-            # Add calculated values
-            for key, value in calculated_values.items():
-                if isinstance(value, str) and value.replace(".", "", 1).isdigit():
-                    result_row[key] = float(value)  # Convert to float if it's a valid decimal number
-                else:
-                    result_row[key] = value
-
-            return result_row
-
-        # Process rows in parallel
-        brokerage_data = []
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            # Create list of future objects
-            futures = {executor.submit(process_row, row): i for i, row in df.iterrows()}
-
-            # Process results as they complete
-            for future in as_completed(futures):
-                row_index = futures[future]
-                progress = ((row_index + 1) / total_rows) * 100
-
-                try:
-                    result = future.result()
-                    brokerage_data.append(result)
-
-                    # Update progress
-                    progress_bar['value'] = progress
-                    progress_label.config(text=f"Processing: {progress:.1f}%")
-                    root_window.update()
-                except Exception as exc:
-                    print(f"Row {row_index} generated an exception: {exc}")
-
-        # Sort results back into original order
-        brokerage_data.sort(key=lambda x: x['SL_N0'])
-
-        # Create a new DataFrame with all the data
-        results_df = pd.DataFrame(brokerage_data)
-
-        # Generate output filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-
-        # Check if OUTPUT directory exists, create it if it doesn't
-        output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "OUTPUT")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"Created output directory: {output_dir}")
-        
-        # Generate output filename with timestamp in the OUTPUT directory
-        output_file = os.path.join(output_dir, f'{symbol}SUMMARY_REPORT{timestamp}_FOptions.xlsx')
-
-        
-
-        # Save to a new Excel file
-        results_df.to_excel(output_file, index=False)
-        print(f"\nResults saved to {output_file}")
-        return output_file, parameter_output
+        return process_input_file(input_file, SEGMENT, mode, scrape=calculate_brokerage, controller=controller,
+                                  progress=update_progress, verify_sample_size=verify_sample_size,
+                                  verify_strategy=verify_strategy, incremental=incremental, sheets=sheets,
+                                  stream_output=stream_output, backend=backend, partition=partition)
 
     except Exception as e:
         print(f"Error processing file: {str(e)}")
+        from tkinter import messagebox
         messagebox.showerror("Error", f"Error processing file: {str(e)}")
         return None, None
 
@@ -267,25 +175,19 @@ def process_excel_file(input_file, progress_bar, progress_label, root_window):
 def find_input_file():
     """Find input files with naming pattern ending with _input.xl* (.xlsx, .xls, etc.) in the current directory"""
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    print(f"Looking for input files in: {current_dir}")
-
-    input_files = []
-    for file in os.listdir(current_dir):
-        file_path = os.path.join(current_dir, file)
-        if os.path.isfile(file_path) and (
-                (file.lower().endswith('_input.xlsx') or
-                 file.lower().endswith('_input.xls') or
-                 file.lower().endswith('_input.csv'))
-        ):
-            input_files.append(file_path)
-            print(f"Found input file: {file_path}")
+    input_files = find_input_files(current_dir)
 
     if input_files:
+        if len(input_files) > 1:
+            print(f"Processing {input_files[0]} only; batch_run.py processes all {len(input_files)} input files")
         return input_files[0]  # Return the first matching file
     return None
 
 
 def open_file_dialog():
+    import tkinter as tk
+    from tkinter import messagebox
+
     # Create the root window with larger dimensions
     root = tk.Tk()
     root.title("Brokerage Calculator")
@@ -346,6 +248,10 @@ def open_file_dialog():
 
 
 if __name__ == "__main__":
+    # Tk is imported for the GUI only, so importing this module as a library stays cheap
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+
     file_path = open_file_dialog()
     if file_path:
         print(f"Selected file: {file_path}")
@@ -380,7 +286,25 @@ if __name__ == "__main__":
         # Start processing in a separate thread to keep UI responsive
         processing_root.update()
 
-        output_file, parameter_output = process_excel_file(file_path, progress_bar, progress_label, processing_root)
+        # BROKERAGE_MODE=calibrated computes rows from a fee schedule instead of scraping each one,
+        # BROKERAGE_MODE=verify does the same and then scrapes BROKERAGE_VERIFY_SAMPLE rows to check them,
+        # BROKERAGE_MODE=local computes from the latest stored schedule without scraping at all;
+        # BROKERAGE_INCREMENTAL=1 reuses the previous report's rows for unchanged input rows;
+        # BROKERAGE_SHEETS=all (or Sheet1,Sheet2) processes several sheets into a multi-sheet report;
+        # BROKERAGE_STREAM_OUTPUT=csv (or xlsx) writes report rows in order as they complete;
+        # BROKERAGE_BACKEND=polars runs local and calibrated mode as one parallel Polars query;
+        # BROKERAGE_PARTITION=symbol writes a report per symbol, BROKERAGE_PARTITION=parquet a partitioned dataset
+        sheets = os.environ.get("BROKERAGE_SHEETS", "")
+        mode = os.environ.get("BROKERAGE_MODE", "scrape")
+        output_file, parameter_output = process_excel_file(
+            file_path, progress_bar, progress_label, processing_root, mode=mode,
+            verify_sample_size=int(os.environ.get("BROKERAGE_VERIFY_SAMPLE", "20")),
+            verify_strategy=os.environ.get("BROKERAGE_VERIFY_STRATEGY", "stratified"),
+            incremental=os.environ.get("BROKERAGE_INCREMENTAL", "0") == "1",
+            sheets=None if not sheets else "all" if sheets == "all" else sheets.split(","),
+            stream_output=os.environ.get("BROKERAGE_STREAM_OUTPUT") or None,
+            backend=os.environ.get("BROKERAGE_BACKEND", "pandas"),
+            partition=os.environ.get("BROKERAGE_PARTITION") or None)
         processing_root.destroy()
 
         if output_file and parameter_output:
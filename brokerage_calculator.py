@@ -0,0 +1,768 @@
+import os
+import importlib
+from datetime import datetime
+
+from concurrency import AdaptiveConcurrencyController, run_adaptive
+from charge_engine import compute_charges, compute_charges_arrays
+from fee_schedule import SEGMENTS, DEFAULT_FEE_SCHEDULES, get_fee_schedule, load_fee_schedule
+from scrape_fixtures import FixtureMiss
+from result_emitter import SINKS, ReorderBuffer
+from trade_records import TradeTable, ResultColumns, report_value
+from input_archive import (archive_input, append_manifest, default_input_dir, file_digest, input_digest,
+                           read_manifest)
+from ingest_cache import cache_enabled, load_cached, read_input_cached, read_sheets_cached, read_source, store_cached
+from input_validation import validate_input
+from instrument_master import fill_lot_sizes
+
+# Script that scrapes each calculator segment; imported only when a scrape is actually needed
+SEGMENT_SCRIPTS = {
+    'options': 'brockerage_foptions',
+    'futures': 'brockerage_ffutures',
+    'delivery': 'brockerage_del_equity',
+    'intraday': 'brockerage_intra_equity',
+}
+
+# Suffix of the report file name written by each segment script
+REPORT_SUFFIXES = {
+    'options': '_FOptions',
+    'futures': '_ffutures',
+    'delivery': '_delequity',
+    'intraday': '_intra_equity',
+}
+
+PARAMETER_COLUMNS = ['SL_N0', 'SYMBOL', 'LOT_SIZE', 'NO_OF_LOTS', 'TOTAL_LOT_SIZE', 'BUY_VALUE', 'SELL_VALUE']
+
+CALCULATION_MODES = ('scrape', 'local', 'calibrated', 'verify')
+
+# Engines for the file pipeline; polars (optional) runs local and calibrated mode as one lazy query
+BACKENDS = ('pandas', 'polars')
+
+# Partitioned outputs (see partitioned_output.py): a report per symbol, or one Hive-partitioned Parquet dataset
+PARTITION_MODES = ('symbol', 'parquet')
+
+# Input files are recognized by these file name endings (case-insensitive)
+INPUT_SUFFIXES = ('_input.xlsx', '_input.xls', '_input.csv')
+
+
+def base_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def is_input_file(file_name):
+    return file_name.lower().endswith(INPUT_SUFFIXES)
+
+
+def find_input_files(directory):
+    """All input files in a directory, sorted by name"""
+    print(f"Looking for input files in: {directory}")
+    input_files = []
+    for file in sorted(os.listdir(directory)):
+        file_path = os.path.join(directory, file)
+        if os.path.isfile(file_path) and is_input_file(file):
+            input_files.append(file_path)
+            print(f"Found input file: {file_path}")
+    return input_files
+
+
+def read_input_sheets(input_file, sheets="all", cache=False):
+    """
+    Several sheets of a workbook as {sheet name: DataFrame}, with the workbook parsed once.
+    sheets is "all" or a list of sheet names; cache is as for read_input.
+    """
+    workbook = read_sheets_cached(input_file) if cache else read_source(input_file, sheet_name=None)
+    if sheets != "all":
+        missing = [name for name in sheets if name not in workbook]
+        if missing:
+            raise ValueError(f"Sheets {', '.join(missing)} not found in {input_file}; it has {', '.join(workbook)}")
+        workbook = {name: workbook[name] for name in sheets}
+    return {name: fill_lot_sizes(df) for name, df in workbook.items()}
+
+
+def read_input(input_file, cache=False):
+    """
+    Load an input workbook or CSV into a DataFrame.
+    With cache=True (what the file pipelines pass, see ingest_cache.cache_enabled), the parsed input is kept in
+    the ingest cache keyed on the file's content hash, so rereading the same workbook skips the Excel parser.
+    Missing LOT_SIZE / TOTAL_LOT_SIZE values are filled from the instrument master.
+    """
+    df = read_input_cached(input_file) if cache else read_source(input_file)
+    return fill_lot_sizes(df)
+
+
+def write_rejected_rows(rejected, input_file, output_dir=None):
+    """
+    Write rejected input rows (or {sheet name: rejected rows}) to OUTPUT/{input name}_REJECTED_ROWS{timestamp}.xlsx
+    and return its path
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_dir = output_dir or os.path.join(base_dir(), "OUTPUT")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    rejected_file = unique_path(output_dir, f"{stem}_REJECTED_ROWS{timestamp}", ".xlsx")
+    if isinstance(rejected, dict):
+        write_sheets(rejected, rejected_file)
+    else:
+        rejected.to_excel(rejected_file, index=False)
+    return rejected_file
+
+
+def validate_rows(df, input_file, output_dir=None):
+    """
+    The valid rows of an input (or {sheet name: rows}); rejected rows are written to a rejected-rows file first.
+    Raises ValueError if a required column is missing or no row is valid, before anything is computed.
+    """
+    if isinstance(df, dict):
+        checked = {sheet_name: validate_input(sheet_df, f"sheet {sheet_name} of {input_file}")
+                   for sheet_name, sheet_df in df.items()}
+        valid = {sheet_name: valid_df for sheet_name, (valid_df, _) in checked.items()}
+        rejected = {sheet_name: rejected_df for sheet_name, (_, rejected_df) in checked.items() if len(rejected_df)}
+        rows = sum(len(sheet_df) for sheet_df in df.values())
+        valid_rows = sum(len(valid_df) for valid_df in valid.values())
+    else:
+        valid, rejected = validate_input(df, input_file)
+        rows, valid_rows = len(df), len(valid)
+
+    report_rejected_rows(rejected, rows, valid_rows, input_file, output_dir)
+    return valid
+
+
+def report_rejected_rows(rejected, rows, valid_rows, input_file, output_dir=None):
+    """Write the rejected rows of an input, if there are any; raises ValueError if no row is valid"""
+    if rows > valid_rows:
+        rejected_file = write_rejected_rows(rejected, input_file, output_dir)
+        print(f"Rejected {rows - valid_rows} of {rows} rows of {input_file}; see {rejected_file}")
+        if not valid_rows:
+            raise ValueError(f"No valid rows in {input_file}; see {rejected_file}")
+
+
+def report_symbol(df):
+    """Symbol used to name the parameter file and report"""
+    return df.iloc[0]['SYMBOL'] if 'SYMBOL' in df.columns and len(df) else "UNKNOWN"
+
+
+def write_sheets(sheets, output_file):
+    """Write {sheet name: DataFrame} to one workbook, a sheet each"""
+    import pandas as pd
+
+    with pd.ExcelWriter(output_file) as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def write_parameter_file(df, symbol=None, parameter_output=None):
+    """
+    Write the input parameter columns to {symbol}_parameter.xlsx and return its path.
+    df may also be {sheet name: DataFrame}, written as one sheet each.
+    """
+    if isinstance(df, dict):
+        symbol = symbol or report_symbol(next(iter(df.values())))
+        parameter_output = parameter_output or f"{symbol}_parameter.xlsx"
+        write_sheets({sheet_name: sheet_df[PARAMETER_COLUMNS] for sheet_name, sheet_df in df.items()},
+                     parameter_output)
+        print(f"Parameter file saved to {parameter_output}")
+        return parameter_output
+
+    symbol = symbol or report_symbol(df)
+    parameter_output = parameter_output or f"{symbol}_parameter.xlsx"
+
+    # Copy the required columns to the first output file
+    parameter_df = df[PARAMETER_COLUMNS].copy()
+    parameter_df.to_excel(parameter_output, index=False)
+    print(f"Parameter file saved to {parameter_output}")
+    return parameter_output
+
+
+def unique_path(directory, stem, suffix, make_dir=False):
+    """
+    directory/{stem}{suffix}, with a counter after stem if that name is taken (same-second timestamps). The name
+    is reserved by creating it exclusively, as an empty file (or a directory with make_dir), so concurrent
+    runs never get the same path; the caller overwrites it.
+    """
+    counter = 1
+    while True:
+        path = os.path.join(directory, f"{stem}{suffix}" if counter == 1 else f"{stem}_{counter}{suffix}")
+        try:
+            if make_dir:
+                os.mkdir(path)
+            else:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            counter += 1
+
+
+def report_path(symbol, suffix="", output_format="xlsx", output_dir=None):
+    """A new OUTPUT/{symbol}SUMMARY_REPORT{timestamp}{suffix}.{output_format} path"""
+    # Generate output filename with timestamp
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    # Check if OUTPUT directory exists, create it if it doesn't
+    output_dir = output_dir or os.path.join(base_dir(), "OUTPUT")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"Created output directory: {output_dir}")
+
+    # Generate output filename with timestamp in the OUTPUT directory
+    return unique_path(output_dir, f'{symbol}SUMMARY_REPORT{timestamp}', f'{suffix}.{output_format}')
+
+
+def write_report(results_df, symbol, suffix="", output_dir=None):
+    """
+    Write the results to OUTPUT/{symbol}SUMMARY_REPORT{timestamp}{suffix}.xlsx and return its path.
+    results_df may also be {sheet name: DataFrame}, written as one sheet each.
+    """
+    output_file = report_path(symbol, suffix, "xlsx", output_dir)
+
+    # Save to a new Excel file
+    if isinstance(results_df, dict):
+        write_sheets(results_df, output_file)
+    else:
+        results_df.to_excel(output_file, index=False)
+    print(f"\nResults saved to {output_file}")
+    return output_file
+
+
+def open_report_sink(symbol, suffix="", output_format="csv", output_dir=None):
+    """
+    A result_emitter sink writing OUTPUT/{symbol}SUMMARY_REPORT{timestamp}{suffix}.csv/.xlsx row by row,
+    for BrokerageCalculator.compute_to. The caller closes it.
+    """
+    return SINKS[output_format](report_path(symbol, suffix, output_format, output_dir))
+
+
+def run_key(calculator):
+    """What a report's rows depend on besides the input: segment, mode and fee schedule version"""
+    return {'segment': calculator.segment, 'mode': calculator.mode,
+            'schedule_version': None if calculator.mode == 'scrape' else calculator.schedule.get('version')}
+
+
+def record_report(input_file, output_file, results_df, calculator, input_dir=None):
+    """
+    Add a manifest entry linking the report to the archived input it was computed from, and cache its rows when
+    the ingest cache is enabled, so a later incremental run can reuse them without re-reading the report workbook.
+    """
+    report_digest = file_digest(output_file)
+    if cache_enabled():
+        store_cached(results_df, report_digest)
+    entry = {'type': 'report', 'archived_at': datetime.now().isoformat(timespec='seconds'),
+             'name': os.path.basename(input_file), 'sha256': input_digest(input_file, input_dir),
+             'report': os.path.abspath(output_file), 'report_sha256': report_digest}
+    entry.update(run_key(calculator))
+    append_manifest(entry, input_dir)
+
+
+def load_prior_run(input_file, calculator, input_dir=None):
+    """
+    (prior input DataFrame, prior results DataFrame) of the latest recorded report for an input file of the
+    same name computed with the same segment, mode and fee schedule version, or None if there is none.
+    """
+    input_dir = input_dir or default_input_dir()
+    name = os.path.basename(input_file)
+    key = run_key(calculator)
+    for entry in reversed(read_manifest(input_dir)):
+        if entry.get('type') != 'report' or entry['name'] != name:
+            continue
+        if any(entry.get(field) != value for field, value in key.items()):
+            continue
+        prior_df = load_cached(entry['sha256'])
+        if prior_df is None:
+            objects = [candidate['object'] for candidate in read_manifest(input_dir)
+                       if candidate.get('type', 'input') == 'input' and candidate['sha256'] == entry['sha256']]
+            if not objects or not os.path.exists(os.path.join(input_dir, objects[-1])):
+                continue
+            prior_df = read_source(os.path.join(input_dir, objects[-1]))
+        prior_results_df = load_cached(entry['report_sha256'])
+        if prior_results_df is None:
+            if not os.path.exists(entry['report']):
+                continue
+            prior_results_df = read_source(entry['report'])
+        print(f"Incremental run against {entry['report']}")
+        # Filled from today's instrument master like the new input, so changed lot sizes show as changed rows
+        return fill_lot_sizes(prior_df), prior_results_df
+    return None
+
+
+class BrokerageCalculator:
+    """
+    In-memory brokerage calculation for one segment, with no file-system side effects.
+
+    mode is one of:
+      scrape     - scrape the calculator page for every row (the scripts' default)
+      local      - compute every row from a fee schedule; uses schedule if given, otherwise the latest
+                   calibrated one, otherwise the published defaults. Never scrapes.
+      calibrated - like local, but calibrates today's fee schedule first if there is none (writes FEE_SCHEDULES/)
+      verify     - like calibrated, then scrapes a sample of rows and adds VERIFY_* columns
+
+    Archival, parameter file and report writing are separate opt-in steps: archive_input,
+    write_parameter_file and write_report.
+    """
+
+    def __init__(self, segment="options", mode="local", schedule=None, scrape=None, controller=None,
+                 verify_sample_size=20, verify_strategy="stratified"):
+        if segment not in SEGMENTS:
+            raise ValueError(f"Unknown segment {segment!r}, expected one of {', '.join(SEGMENTS)}")
+        if mode not in CALCULATION_MODES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {', '.join(CALCULATION_MODES)}")
+        self.segment = segment
+        self.mode = mode
+        self.controller = controller
+        self.verify_sample_size = verify_sample_size
+        self.verify_strategy = verify_strategy
+        self.stats = {}
+        self.reorder_window = 0
+        self.row_stats = {}
+        self._schedule = schedule
+        self._scrape = scrape
+
+    @property
+    def scrape(self):
+        """The segment's calculate_brokerage, imported from its script on first use"""
+        if self._scrape is None:
+            self._scrape = importlib.import_module(SEGMENT_SCRIPTS[self.segment]).calculate_brokerage
+        return self._scrape
+
+    @property
+    def schedule(self):
+        if self._schedule is None:
+            if self.mode in ('calibrated', 'verify'):
+                self._schedule = get_fee_schedule(self.segment, self.scrape)
+            else:
+                self._schedule = (load_fee_schedule(self.segment)
+                                  or dict(DEFAULT_FEE_SCHEDULES[self.segment], segment=self.segment, version=0))
+        return self._schedule
+
+    def calculate(self, lot_size, total_lot_size, buy_value, sell_value):
+        """Charges for one trade, as a calculate_brokerage style dict"""
+        if self.mode == 'scrape':
+            return self.scrape(lot_size, total_lot_size, buy_value, sell_value)
+        return compute_charges(self.schedule, lot_size, total_lot_size, buy_value, sell_value)
+
+    def compute_one(self, lot_size, no_of_lots, buy_value, sell_value, symbol="UNKNOWN", sl_no=1):
+        """Result row for a single trade"""
+        return self._process_row({'SL_N0': sl_no, 'SYMBOL': symbol, 'LOT_SIZE': lot_size, 'NO_OF_LOTS': no_of_lots,
+                                  'TOTAL_LOT_SIZE': lot_size * no_of_lots, 'BUY_VALUE': buy_value,
+                                  'SELL_VALUE': sell_value})
+
+    def compute(self, df, progress=None):
+        """
+        Compute the report rows for an input DataFrame and return them as a new DataFrame sorted by SL_N0.
+        progress(done, total) is called from the calling thread as rows complete.
+        """
+        if self.mode == 'scrape':
+            results_df = self._compute_rows(df, progress)
+        else:
+            results_df = self._compute_local(df)
+            if progress:
+                progress(len(df), len(df))
+
+        self.stats = {'rows': len(df), 'computed': len(results_df), 'failed': len(df) - len(results_df)}
+        if self.mode == 'scrape':
+            self.stats.update(self.row_stats)
+        if self.mode == 'verify':
+            from verification import verify_results
+            results_df, self.stats['verification'] = verify_results(
+                df, results_df, self.scrape, self.verify_sample_size, self.verify_strategy,
+                controller=self.controller)
+        return results_df
+
+    def compute_to(self, df, sink, progress=None):
+        """
+        Like compute, but result rows are written to sink (see result_emitter) instead of returned. When scraping,
+        each row is written as soon as all lower SL_N0 rows are done and only the out-of-order window is held.
+        """
+        if self.mode != 'scrape':
+            for row in self.compute(df, progress).to_dict('records'):
+                sink.write(row)
+            return self.stats
+
+        self._compute_row_groups([df], progress, [sink])
+        self.stats = {'rows': len(df), 'computed': sink.rows, 'failed': len(df) - sink.rows,
+                      'reorder_window': self.reorder_window}
+        self.stats.update(self.row_stats)
+        return self.stats
+
+    def compute_many(self, dfs, progress=None):
+        """
+        compute for several input DataFrames at once; returns one results DataFrame per input.
+        In scrape mode the rows of all inputs share one adaptive pool, interleaved so that the pool stays
+        saturated until the last row of the last input.
+        """
+        if self.mode == 'scrape':
+            results = self._compute_row_groups(dfs, progress)
+            self.stats = {'rows': sum(len(df) for df in dfs), 'computed': sum(len(df) for df in results)}
+            self.stats['failed'] = self.stats['rows'] - self.stats['computed']
+            self.stats.update(self.row_stats)
+            return results
+
+        results = []
+        totals = {'rows': 0, 'computed': 0, 'failed': 0}
+        total_rows = sum(len(df) for df in dfs)
+        for df in dfs:
+            results.append(self.compute(df))
+            for key in totals:
+                totals[key] += self.stats[key]
+            if progress:
+                progress(totals['rows'], total_rows)
+        self.stats = totals
+        return results
+
+    def compute_incremental(self, df, prior_df, prior_results_df, progress=None):
+        """
+        Like compute, but only rows that are new or whose input values changed since prior_df are computed;
+        the other rows are taken from prior_results_df (the report computed from prior_df).
+        """
+        import pandas as pd
+
+        if df['SL_N0'].duplicated().any() or prior_df['SL_N0'].duplicated().any():
+            print("SL_N0 is not unique, recomputing all rows")
+            return self.compute(df, progress)
+
+        value_columns = PARAMETER_COLUMNS[1:]
+        merged = df[PARAMETER_COLUMNS].merge(prior_df[PARAMETER_COLUMNS], on='SL_N0', how='left',
+                                             suffixes=('', '_PRIOR'))
+        changed = ~merged['SL_N0'].isin(prior_results_df['SL_N0']).to_numpy()
+        for column in value_columns:
+            current, prior = merged[column], merged[f"{column}_PRIOR"]
+            changed |= ~((current == prior) | (current.isna() & prior.isna())).to_numpy()
+
+        changed_df = df[df['SL_N0'].isin(merged.loc[changed, 'SL_N0'])]
+        reused_df = prior_results_df[prior_results_df['SL_N0'].isin(merged.loc[~changed, 'SL_N0'])]
+        print(f"Incremental: {len(changed_df)} new or changed rows, {len(reused_df)} reused")
+
+        if len(changed_df):
+            computed_df = self.compute(changed_df, progress)
+            columns = computed_df.columns if len(computed_df.columns) else reused_df.columns
+            results_df = pd.concat([reused_df, computed_df], ignore_index=True)[columns]
+        else:
+            self.stats = {'rows': 0, 'computed': 0, 'failed': 0}
+            results_df = reused_df.copy()
+            if progress:
+                progress(len(df), len(df))
+        results_df = results_df.sort_values('SL_N0', kind='stable').reset_index(drop=True)
+
+        self.stats['rows'] = len(df)
+        self.stats['reused'] = len(reused_df)
+        return results_df
+
+    def _process_row(self, row_data):
+        # Get brokerage calculations
+        calculated_values = self.calculate(*self._call_args(row_data))
+        return self._result_row(row_data, calculated_values)
+
+    @staticmethod
+    def _call_args(row_data):
+        """calculate() arguments for a row; the charges depend on all but lot_size (see TradeTable.call_key)"""
+        lot_size = int(row_data['LOT_SIZE'])
+        return (lot_size, lot_size * int(row_data['NO_OF_LOTS']), float(row_data['BUY_VALUE']),
+                float(row_data['SELL_VALUE']))
+
+    @staticmethod
+    def _result_row(row_data, calculated_values):
+        lot_size = int(row_data['LOT_SIZE'])
+        no_of_lots = int(row_data['NO_OF_LOTS'])
+        buy_value = float(row_data['BUY_VALUE'])
+        sell_value = float(row_data['SELL_VALUE'])
+        buy_turnover = (buy_value + sell_value) * no_of_lots * lot_size
+
+        # Prepare row data
+        result_row = {
+            'SL_N0': row_data['SL_N0'],
+            'SYMBOLS': row_data['SYMBOL'],
+            'LOT_SIZE': lot_size,
+            "PREMUIM_VALUE": buy_value + sell_value,
+            'NO_OF_LOTS': row_data['NO_OF_LOTS'],
+            'TOTAL_LOT_SIZE': row_data['TOTAL_LOT_SIZE'],
+            'TOTAL_PREMIUM_VALUE': buy_turnover,
+        }
+
+        # Add calculated values
+        for key, value in calculated_values.items():
+            result_row[key] = report_value(value)  # Convert to float if it's a valid decimal number
+
+        return result_row
+
+    def _compute_rows(self, df, progress=None):
+        """Compute row by row on the adaptive worker pool (each row may drive a browser)"""
+        return self._compute_row_groups([df], progress)[0]
+
+    def _compute_row_groups(self, dfs, progress=None, sinks=None):
+        """
+        Row-wise computation of several inputs on one adaptive pool, taking rows from each input in turn.
+        Rows with the same calculate() arguments are computed once: later rows reuse the charges of an earlier
+        call, or wait for it if it is still running. Results pass through a reorder buffer per input, so they come
+        out in SL_N0 order as soon as all lower rows are done: into sinks[i].write if sinks are given (nothing
+        is retained), otherwise into DataFrames.
+        """
+        tables = [TradeTable(df) for df in dfs]
+        results = [ResultColumns(table) for table in tables]
+        buffers = [ReorderBuffer(sinks[group].write) for group in range(len(dfs))] if sinks else None
+        total_rows = sum(len(table) for table in tables)
+        done = [0]
+        charges_by_key = {}   # charges of completed calls, by TradeTable.call_key
+        waiting = {}          # rows (group, position) waiting on a call in flight, by its key
+        calls = [0]
+
+        def emit(row, calculated_values):
+            group, position = row
+            try:
+                if buffers:
+                    buffers[group].add(position, tables[group].result_row(position, calculated_values))
+                else:
+                    results[group].set(position, calculated_values)
+                done[0] += 1
+            except Exception as exc:
+                fail(row, exc)
+
+        def fail(row, exc):
+            group, position = row
+            if buffers:
+                buffers[group].skip(position)
+            where = f" of input {group + 1}" if len(dfs) > 1 else ""
+            print(f"Row {tables[group].index[position]}{where} generated an exception: {exc}")
+
+        def on_result(call_key, future):
+            rows = waiting.pop(call_key)
+            try:
+                calculated_values = future.result()
+                if calculated_values is None:
+                    # The segment scripts' calculate_brokerage returns None when a scrape fails
+                    raise ValueError("the calculator returned no charges")
+            except FixtureMiss:
+                # Replay mode must not silently drop rows that were never recorded
+                raise
+            except Exception as exc:
+                # Not remembered (nor a None result): a later row with the same key tries again
+                for row in rows:
+                    fail(row, exc)
+            else:
+                charges_by_key[call_key] = calculated_values
+                for row in rows:
+                    emit(row, calculated_values)
+            if progress:
+                progress(done[0], total_rows)
+
+        def unique_calls():
+            # Take rows from each input in turn
+            for position in range(max((len(table) for table in tables), default=0)):
+                for group, table in enumerate(tables):
+                    if position >= len(table):
+                        continue
+                    row = (group, position)
+                    if not table.valid[position]:
+                        fail(row, table.errors[position])
+                        continue
+                    call_key = table.call_key(position)
+                    if call_key in charges_by_key:
+                        emit(row, charges_by_key[call_key])
+                    elif call_key in waiting:
+                        waiting[call_key].append(row)
+                    else:
+                        # The first row's arguments stand for every row with the same key
+                        waiting[call_key] = [row]
+                        calls[0] += 1
+                        yield call_key, table.call_args(position)
+
+        run_adaptive(lambda call_args: self.calculate(*call_args), unique_calls(),
+                     self.controller or AdaptiveConcurrencyController(), on_result)
+        self.reorder_window = max((buffer.max_window for buffer in buffers or []), default=0)
+        self.row_stats = {'calls': calls[0], 'dedup_ratio': round(total_rows / calls[0], 2) if calls[0] else 0.0}
+        print(f"Computed {total_rows} rows with {calls[0]} calculator calls "
+              f"(dedup ratio {self.row_stats['dedup_ratio']})")
+        if sinks:
+            return None
+        return [columns.to_frame() for columns in results]
+
+    def _compute_local(self, df):
+        """Compute all rows at once with the vectorized engine"""
+        import pandas as pd
+
+        df = df.sort_values('SL_N0', kind='stable')
+        lot_size = df['LOT_SIZE'].astype(int).to_numpy()
+        total_lot_size = lot_size * df['NO_OF_LOTS'].astype(int).to_numpy()
+        buy_value = df['BUY_VALUE'].astype(float).to_numpy()
+        sell_value = df['SELL_VALUE'].astype(float).to_numpy()
+        charges = compute_charges_arrays(self.schedule, total_lot_size, buy_value, sell_value)
+
+        results_df = pd.DataFrame({
+            'SL_N0': df['SL_N0'].to_numpy(),
+            'SYMBOLS': df['SYMBOL'].to_numpy(),
+            'LOT_SIZE': lot_size,
+            "PREMUIM_VALUE": buy_value + sell_value,
+            'NO_OF_LOTS': df['NO_OF_LOTS'].to_numpy(),
+            'TOTAL_LOT_SIZE': df['TOTAL_LOT_SIZE'].to_numpy(),
+            'TOTAL_PREMIUM_VALUE': (buy_value + sell_value) * total_lot_size,
+        })
+        for key, values in charges.items():
+            results_df[key] = values
+        results_df['BROKERAGE %'] = [f"{value}%" for value in charges['BROKERAGE %'].tolist()]
+        return results_df
+
+
+def use_polars(backend, mode, unsupported=False):
+    """Whether a run goes to the Polars backend; runs it does not cover fall back to pandas with a note"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if backend != 'polars':
+        return False
+    if mode not in ('local', 'calibrated') or unsupported:
+        print("The Polars backend covers local and calibrated runs of single-sheet, non-incremental inputs; "
+              "using pandas")
+        return False
+    return True
+
+
+def process_input_file(input_file, segment="options", mode="scrape", scrape=None, controller=None, progress=None,
+                       verify_sample_size=20, verify_strategy="stratified", incremental=False, sheets=None,
+                       stream_output=None, backend="pandas", partition=None, parameter_output=None):
+    """
+    The whole file pipeline without any GUI: archive the input, write the parameter file (to parameter_output,
+    default {symbol}_parameter.xlsx), compute and write the report. Returns (report path, parameter file path);
+    errors propagate to the caller.
+    sheets ("all" or a list of sheet names) processes several sheets of the workbook; by default only the first
+    sheet is read.
+    stream_output ("csv" or "xlsx") writes report rows in SL_N0 order while the run is in progress instead of
+    collecting them; such reports are not recorded for incremental runs.
+    backend="polars" computes local and calibrated runs with polars_backend instead.
+    partition ("symbol" or "parquet") writes the report split by SYMBOL (see partitioned_output) and a parameter
+    file per symbol; it returns (partition index or Parquet dataset directory, list of parameter file paths).
+    Partitioned reports are not recorded for incremental runs.
+    """
+    if partition not in (None,) + PARTITION_MODES:
+        raise ValueError(f"Unknown partition {partition!r}, expected one of {', '.join(PARTITION_MODES)}")
+    if partition and (sheets or stream_output):
+        print("Partitioned output covers single-sheet, non-streamed runs; writing one report")
+        partition = None
+    if use_polars(backend, mode, incremental or sheets):
+        from polars_backend import process_input_file_polars
+        return process_input_file_polars(input_file, segment, mode, stream_output, partition, parameter_output)
+
+    # Keep a copy of the input in the INPUT archive, then read it
+    archive_input(input_file)
+    if sheets:
+        if incremental:
+            print("Incremental runs cover single-sheet inputs only, computing every sheet")
+        return process_input_sheets(input_file, sheets, segment, mode, scrape, controller, progress,
+                                    verify_sample_size, verify_strategy, parameter_output)
+    df = validate_rows(read_input(input_file, cache=cache_enabled()), input_file)
+
+    print(f"Processing {len(df)} rows from {input_file}")
+    symbol = report_symbol(df)
+    # Partitioned outputs get a parameter file per symbol instead
+    parameter_output = write_parameter_file(df, symbol, parameter_output) if not partition else None
+
+    calculator = BrokerageCalculator(segment, mode, scrape=scrape, controller=controller,
+                                     verify_sample_size=verify_sample_size, verify_strategy=verify_strategy)
+    if stream_output:
+        sink = open_report_sink(symbol, REPORT_SUFFIXES[segment], stream_output)
+        try:
+            stats = calculator.compute_to(df, sink, progress)
+        finally:
+            sink.close()
+        if 'reorder_window' in stats:
+            print(f"Streamed {sink.rows} rows, at most {stats['reorder_window']} held back for ordering")
+        print(f"\nResults saved to {sink.path}")
+        return sink.path, parameter_output
+
+    # Incremental runs recompute only the rows that changed since the last report for this input
+    prior_run = load_prior_run(input_file, calculator) if incremental else None
+    if prior_run:
+        results_df = calculator.compute_incremental(df, *prior_run, progress=progress)
+    else:
+        results_df = calculator.compute(df, progress)
+
+    if partition:
+        from partitioned_output import write_partitions
+        return write_partitions(df, results_df, REPORT_SUFFIXES[segment], partition, input_file)
+
+    output_file = write_report(results_df, symbol, REPORT_SUFFIXES[segment])
+    record_report(input_file, output_file, results_df, calculator)
+    return output_file, parameter_output
+
+
+def process_input_sheets(input_file, sheets="all", segment="options", mode="scrape", scrape=None, controller=None,
+                         progress=None, verify_sample_size=20, verify_strategy="stratified", parameter_output=None):
+    """
+    Multi-sheet variant of process_input_file (after archival): the sheets are read in one pass over the
+    workbook and computed together, sharing one calculator and worker pool, into a report and parameter file
+    with one sheet per input sheet.
+    """
+    workbook = validate_rows(read_input_sheets(input_file, sheets, cache=cache_enabled()), input_file)
+    print(f"Processing {sum(len(df) for df in workbook.values())} rows from {len(workbook)} sheets of {input_file}")
+    symbol = report_symbol(next(iter(workbook.values())))
+    parameter_output = write_parameter_file(workbook, symbol, parameter_output)
+
+    calculator = BrokerageCalculator(segment, mode, scrape=scrape, controller=controller,
+                                     verify_sample_size=verify_sample_size, verify_strategy=verify_strategy)
+    results = calculator.compute_many(list(workbook.values()), progress)
+
+    output_file = write_report(dict(zip(workbook, results)), symbol, REPORT_SUFFIXES[segment])
+    return output_file, parameter_output
+
+
+def write_batch_index(index_rows, output_dir=None, stem="BATCH_INDEX"):
+    """Write one row per processed input file (or partition) to OUTPUT/{stem}{timestamp}.xlsx and return its path"""
+    import pandas as pd
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_dir = output_dir or os.path.join(base_dir(), "OUTPUT")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    index_file = unique_path(output_dir, f'{stem}{timestamp}', '.xlsx')
+    pd.DataFrame(index_rows).to_excel(index_file, index=False)
+    print(f"Index saved to {index_file}")
+    return index_file
+
+
+def process_input_files(input_files, segment="options", mode="scrape", scrape=None, controller=None,
+                        progress=None, verify_sample_size=20, verify_strategy="stratified", backend="pandas"):
+    """
+    process_input_file for several files in one run: all rows go through one calculator (and in scrape mode one
+    shared worker pool), each file gets its own parameter file and report, and a combined index lists them.
+    Returns the index path. Files that cannot be read are listed in the index with their error.
+    """
+    if use_polars(backend, mode):
+        from polars_backend import process_input_files_polars
+        return process_input_files_polars(input_files, segment, mode)
+
+    index_rows = []
+    inputs = []
+    symbols = {}
+    for input_file in input_files:
+        try:
+            archive_input(input_file)
+            input_df = read_input(input_file, cache=cache_enabled())
+            df = validate_rows(input_df, input_file)
+            symbol = report_symbol(df)
+            # Several files for one symbol would overwrite each other's parameter file
+            parameter_output = (f"{symbol}_parameter.xlsx" if symbol not in symbols else
+                                f"{os.path.splitext(os.path.basename(input_file))[0]}_parameter.xlsx")
+            symbols[symbol] = input_file
+            write_parameter_file(df, symbol, parameter_output)
+            inputs.append((input_file, df, symbol, parameter_output, len(input_df) - len(df)))
+        except Exception as exc:
+            print(f"Error reading {input_file}: {exc}")
+            index_rows.append({'INPUT_FILE': input_file, 'ERROR': str(exc)})
+    print(f"Processing {sum(len(df) for _, df, _, _, _ in inputs)} rows from {len(inputs)} files")
+
+    calculator = BrokerageCalculator(segment, mode, scrape=scrape, controller=controller,
+                                     verify_sample_size=verify_sample_size, verify_strategy=verify_strategy)
+    results = calculator.compute_many([df for _, df, _, _, _ in inputs], progress)
+
+    for (input_file, df, symbol, parameter_output, rejected_rows), results_df in zip(inputs, results):
+        output_file = write_report(results_df, symbol, REPORT_SUFFIXES[segment])
+        record_report(input_file, output_file, results_df, calculator)
+        index_rows.append({
+            'INPUT_FILE': input_file,
+            'SYMBOL': symbol,
+            'ROWS': len(df) + rejected_rows,
+            'REJECTED': rejected_rows,
+            'COMPUTED': len(results_df),
+            'FAILED': len(df) - len(results_df),
+            'TOTAL_PREMIUM_VALUE': float(results_df['TOTAL_PREMIUM_VALUE'].sum()) if len(results_df) else 0.0,
+            'TOTAL TAX AND CHARGES': float(results_df['TOTAL TAX AND CHARGES'].sum()) if len(results_df) else 0.0,
+            'REPORT': output_file,
+            'PARAMETER_FILE': parameter_output,
+        })
+    index_rows.sort(key=lambda row: input_files.index(row['INPUT_FILE']))
+    return write_batch_index(index_rows)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Long-running charge estimation service.
+
+Keeps the charge engine and fee schedules loaded so callers do not pay interpreter, pandas, selenium and Tk
+start-up per estimate. Concurrent requests are coalesced into micro-batches and evaluated with the vectorized
+engine. Serves HTTP (keep-alive) or newline-delimited JSON over a Unix socket:
+
+    python calc_service.py --port 8766
+    curl -d '{"segment": "options", "lot_size": 20, "no_of_lots": 1, "buy_value": 348, "sell_value": 348}' \\
+        http://127.0.0.1:8766/estimate
+
+    python calc_service.py --unix /tmp/brokerage.sock
+
+A request is one trade object or a list of them. A trade gives segment (options, futures, delivery, intraday),
+buy_value, sell_value and either total_lot_size / quantity or lot_size and no_of_lots.
+"""
+import os
+import math
+import json
+import queue
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from charge_engine import compute_charges, compute_charges_arrays
+from fee_schedule import SEGMENTS, DEFAULT_FEE_SCHEDULES, load_fee_schedule
+
+
+def load_service_schedules(schedule_dir=None):
+    """Latest calibrated schedule per segment; the published defaults stand in for uncalibrated segments"""
+    schedules = {}
+    for segment in SEGMENTS:
+        schedule = load_fee_schedule(segment, schedule_dir)
+        if schedule is None:
+            print(f"No calibrated fee schedule for {segment}, using published defaults")
+            schedule = dict(DEFAULT_FEE_SCHEDULES[segment], segment=segment, version=0)
+        schedules[segment] = schedule
+    return schedules
+
+
+def parse_trade(trade):
+    """Return (segment, total_lot_size, buy_value, sell_value) for one request trade"""
+    if not isinstance(trade, dict):
+        raise TypeError(f"A trade must be a JSON object, got {type(trade).__name__}")
+    segment = trade.get('segment', 'options')
+    if segment not in SEGMENTS:
+        raise ValueError(f"Unknown segment {segment!r}, expected one of {', '.join(SEGMENTS)}")
+    try:
+        quantity = trade.get('total_lot_size', trade.get('quantity'))
+        if quantity is None:
+            quantity = int(trade['lot_size']) * int(trade.get('no_of_lots', 1))
+        quantity, buy_value, sell_value = int(quantity), float(trade['buy_value']), float(trade['sell_value'])
+    except OverflowError:
+        raise ValueError("Trade quantities must be finite numbers")
+    # The negated range check also rejects NaN
+    if quantity < 0 or not (0 <= buy_value < math.inf and 0 <= sell_value < math.inf):
+        raise ValueError("Trade quantities and values must be non-negative finite numbers")
+    return segment, quantity, buy_value, sell_value
+
+
+class MicroBatcher:
+    """
+    Single evaluation thread fed by a queue. Each pass takes everything that queued up while the previous pass
+    ran (up to max_batch trades), optionally waits max_wait seconds for more, and evaluates the batch per segment.
+    An idle service therefore adds no batching delay, and a busy one amortizes the per-call overhead.
+    """
+
+    def __init__(self, schedules, max_batch=4096, max_wait=0.0, vector_threshold=16):
+        self.schedules = schedules
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.vector_threshold = vector_threshold
+        self.batches = 0
+        self.trades = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, trades):
+        """Queue a list of parsed trades; the returned future resolves to a list of charge dicts"""
+        future = Future()
+        self._queue.put((trades, future))
+        return future
+
+    def estimate(self, trades, timeout=None):
+        return self.submit(trades).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        while size < self.max_batch:
+            try:
+                item = self._queue.get(timeout=self.max_wait) if self.max_wait else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self._evaluate([trade for trades, _ in batch for trade in trades])
+            except Exception:
+                # Evaluate the requests one by one, so the error stays with the request that caused it
+                for trades, future in batch:
+                    try:
+                        future.set_result(self._evaluate(trades))
+                        self.trades += len(trades)
+                    except Exception as exc:
+                        future.set_exception(exc)
+                self.batches += 1
+                continue
+
+            self.batches += 1
+            self.trades += len(results)
+            start = 0
+            for trades, future in batch:
+                future.set_result(results[start:start + len(trades)])
+                start += len(trades)
+
+    def _evaluate(self, trades):
+        results = [None] * len(trades)
+        by_segment = {}
+        for position, trade in enumerate(trades):
+            by_segment.setdefault(trade[0], []).append(position)
+
+        for segment, positions in by_segment.items():
+            schedule = self.schedules[segment]
+            if len(positions) < self.vector_threshold:
+                # NumPy call overhead dominates tiny batches
+                for position in positions:
+                    _, quantity, buy_value, sell_value = trades[position]
+                    results[position] = compute_charges(schedule, quantity, quantity, buy_value, sell_value)
+                continue
+
+            arrays = compute_charges_arrays(schedule,
+                                            [trades[position][1] for position in positions],
+                                            [trades[position][2] for position in positions],
+                                            [trades[position][3] for position in positions])
+            columns = {key: values.tolist() for key, values in arrays.items()}
+            for index, position in enumerate(positions):
+                row = {key: values[index] for key, values in columns.items()}
+                row["BROKERAGE %"] = f"{row['BROKERAGE %']}%"
+                results[position] = row
+        return results
+
+
+class CalculationService:
+    def __init__(self, schedule_dir=None, max_batch=4096, max_wait=0.0):
+        self.schedule_dir = schedule_dir
+        self.batcher = MicroBatcher(load_service_schedules(schedule_dir), max_batch, max_wait)
+
+    def reload(self):
+        """Pick up newly calibrated schedules without restarting"""
+        self.batcher.schedules = load_service_schedules(self.schedule_dir)
+        return self.versions()
+
+    def versions(self):
+        return {segment: schedule.get('version') for segment, schedule in self.batcher.schedules.items()}
+
+    def handle(self, payload):
+        """Estimate one trade (dict) or a batch (list); returns the matching JSON-serializable result"""
+        single = isinstance(payload, dict)
+        if not single and not isinstance(payload, list):
+            raise TypeError(f"A request must be a trade object or a list of them, got {type(payload).__name__}")
+        trades = [parse_trade(trade) for trade in ([payload] if single else payload)]
+        results = self.batcher.estimate(trades)
+        return results[0] if single else results
+
+
+def make_http_handler(service):
+    class ServiceHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out as separate writes; without this, delayed ACKs add ~40ms per request
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, {'status': 'ok', 'schedules': service.versions(),
+                                 'batches': service.batcher.batches, 'trades': service.batcher.trades})
+            else:
+                self._send(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length)
+            if self.path == '/reload':
+                self._send(200, {'schedules': service.reload()})
+                return
+            if self.path != '/estimate':
+                self._send(404, {'error': f"Unknown path {self.path}"})
+                return
+            try:
+                self._send(200, service.handle(json.loads(body)))
+            except (ValueError, KeyError, TypeError) as exc:
+                self._send(400, {'error': str(exc)})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ServiceHandler
+
+
+def make_unix_handler(service):
+    class LineHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    response = service.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError) as exc:
+                    response = {'error': str(exc)}
+                self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+                self.wfile.flush()
+
+    return LineHandler
+
+
+def create_server(service, host="127.0.0.1", port=8766, unix_socket=None):
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = socketserver.ThreadingUnixStreamServer(unix_socket, make_unix_handler(service))
+    else:
+        server = ThreadingHTTPServer((host, port), make_http_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistent brokerage charge estimation service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--unix", default=None, help="serve newline-delimited JSON on this Unix socket instead")
+    parser.add_argument("--schedule-dir", default=None)
+    parser.add_argument("--max-batch", type=int, default=4096)
+    parser.add_argument("--max-wait", type=float, default=0.0,
+                        help="seconds to wait for more requests before evaluating a batch")
+    args = parser.parse_args()
+
+    service = CalculationService(args.schedule_dir, args.max_batch, args.max_wait)
+    server = create_server(service, args.host, args.port, args.unix)
+    print(f"Calculation service listening on {args.unix or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for https://zerodha.com/brokerage-calculator/ so the scraping code can be run and load-tested
+without network access.
+
+The page has the same input classes (opt_bp, fut_qty, ...) and result ids (opt_brokerage, fut_total,
+sebi_delivery, stamp_duty, ...) as the real calculator and recomputes the results on every keystroke from a
+fee schedule (the latest calibrated one per segment, or the published defaults). Latency and errors can be
+injected per request.
+
+    python calculator_server.py --port 8765 --latency 0.2 --jitter 0.1 --error-rate 0.05
+    BROKERAGE_CALCULATOR_URL=http://127.0.0.1:8765/brokerage-calculator/ python brockerage_foptions.py
+
+GET /stats returns request counts and the peak number of concurrent page loads as JSON.
+"""
+import json
+import random
+import threading
+import time
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from fee_schedule import SEGMENTS, DEFAULT_FEE_SCHEDULES, load_fee_schedule
+
+# Element naming per segment on the real page: input/result prefix, SEBI id and stamp duty id
+SEGMENT_ELEMENTS = {
+    'intraday': ('intra', 'sebi', 'stamp_duty'),
+    'delivery': ('del', 'sebi_delivery', 'stamp_duty_delivery'),
+    'futures': ('fut', 'sebi_fut', 'stamp_duty_fut'),
+    'options': ('opt', 'sebi_opt', 'stamp_duty_opt'),
+}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Brokerage calculator (local stand-in)</title></head>
+<body>
+{sections}
+<script>
+const SCHEDULES = {schedules};
+const ELEMENTS = {elements};
+
+function roundHalfUp(value, decimals) {{
+    const multiplier = Math.pow(10, decimals);
+    return Math.floor(value * multiplier + 0.5 + 1e-9) / multiplier;
+}}
+
+function orderBrokerage(s, leg) {{
+    if (leg <= 0) return 0;
+    if (s.brokerage_rate === null) return s.brokerage_cap;
+    if (s.brokerage_cap === null) return s.brokerage_rate * leg;
+    return Math.min(s.brokerage_rate * leg, s.brokerage_cap);
+}}
+
+function recalc(segment) {{
+    const s = SCHEDULES[segment];
+    const [prefix, sebiId, stampId] = ELEMENTS[segment];
+    const value = (cls) => parseFloat(document.querySelector("." + prefix + "_" + cls).value) || 0;
+    const qty = value("qty");
+    const buy = value("bp") * qty, sell = value("sp") * qty, turnover = buy + sell;
+
+    const brokerage = roundHalfUp(orderBrokerage(s, buy) + orderBrokerage(s, sell), 2);
+    const stt = roundHalfUp(s.stt_buy_rate * buy + s.stt_sell_rate * sell, s.stt_decimals);
+    const etc = roundHalfUp(roundHalfUp(s.exchange_rate * turnover, 2) + roundHalfUp(s.ipft_rate * turnover, 2), 2);
+    const sebi = roundHalfUp(s.sebi_rate * turnover, 2);
+    const gst = roundHalfUp(s.gst_rate * (brokerage + etc + sebi), 2);
+    const stamp = roundHalfUp(s.stamp_rate * buy, s.stamp_decimals);
+    const total = roundHalfUp(brokerage + stt + etc + gst + sebi + stamp, 2);
+    const breakeven = qty ? roundHalfUp(total / qty, 2) : 0;
+
+    const show = (id, v) => {{ document.getElementById(id).innerHTML = v.toFixed(2); }};
+    show(prefix + "_brokerage", brokerage);
+    show(prefix + "_stt", stt);
+    show(prefix + "_etc", etc);
+    show(prefix + "_st", gst);
+    show(sebiId, sebi);
+    show(stampId, stamp);
+    show(prefix + "_total", total);
+    show(prefix + "_breakeven", breakeven);
+}}
+
+for (const segment of Object.keys(ELEMENTS)) {{
+    const prefix = ELEMENTS[segment][0];
+    for (const cls of ["bp", "sp", "qty"]) {{
+        const input = document.querySelector("." + prefix + "_" + cls);
+        input.addEventListener("input", () => recalc(segment));
+        input.addEventListener("change", () => recalc(segment));
+    }}
+    recalc(segment);
+}}
+</script>
+</body>
+</html>
+"""
+
+SECTION_TEMPLATE = """<div id="tab-{segment}">
+  <h2>{segment}</h2>
+  <input type="text" class="{prefix}_bp"> <input type="text" class="{prefix}_sp"> <input type="text" class="{prefix}_qty">
+  <table>
+    <tr><td>Brokerage</td><td id="{prefix}_brokerage">0.00</td></tr>
+    <tr><td>STT total</td><td id="{prefix}_stt">0.00</td></tr>
+    <tr><td>Exchange txn charge</td><td id="{prefix}_etc">0.00</td></tr>
+    <tr><td>GST</td><td id="{prefix}_st">0.00</td></tr>
+    <tr><td>SEBI charges</td><td id="{sebi_id}">0.00</td></tr>
+    <tr><td>Stamp duty</td><td id="{stamp_id}">0.00</td></tr>
+    <tr><td>Total tax and charges</td><td id="{prefix}_total">0.00</td></tr>
+    <tr><td>Points to breakeven</td><td id="{prefix}_breakeven">0.00</td></tr>
+  </table>
+</div>"""
+
+
+def load_schedules(schedule_dir=None):
+    """Latest calibrated schedule per segment, falling back to the published defaults"""
+    schedules = {}
+    for segment in SEGMENTS:
+        schedule = load_fee_schedule(segment, schedule_dir) or DEFAULT_FEE_SCHEDULES[segment]
+        schedules[segment] = {key: schedule[key] for key in DEFAULT_FEE_SCHEDULES[segment]}
+    return schedules
+
+
+def render_page(schedules):
+    sections = "\n".join(
+        SECTION_TEMPLATE.format(segment=segment, prefix=prefix, sebi_id=sebi_id, stamp_id=stamp_id)
+        for segment, (prefix, sebi_id, stamp_id) in SEGMENT_ELEMENTS.items())
+    return PAGE_TEMPLATE.format(sections=sections, schedules=json.dumps(schedules),
+                                elements=json.dumps(SEGMENT_ELEMENTS))
+
+
+class ServerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def start(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finish(self, error=False):
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.errors += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors, 'in_flight': self.in_flight,
+                    'peak_in_flight': self.peak_in_flight}
+
+
+def make_handler(page, latency=0.0, jitter=0.0, error_rate=0.0, stats=None, seed=None):
+    """Build a request handler serving page with the given artificial latency (seconds) and error rate"""
+    stats = stats or ServerStats()
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class CalculatorHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/stats'):
+                self._send(200, json.dumps(stats.as_dict()), 'application/json')
+                return
+
+            stats.start()
+            with rng_lock:
+                delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+                fail = rng.random() < error_rate
+            try:
+                time.sleep(delay)
+                if fail:
+                    self._send(503, "Injected error", 'text/plain')
+                else:
+                    self._send(200, page, 'text/html; charset=utf-8')
+            finally:
+                stats.finish(error=fail)
+
+        def _send(self, status, body, content_type):
+            payload = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            # Keep the console quiet under load
+            pass
+
+    CalculatorHandler.stats = stats
+    return CalculatorHandler
+
+
+def serve(host="127.0.0.1", port=8765, latency=0.0, jitter=0.0, error_rate=0.0, schedule_dir=None, seed=None):
+    """Create (but do not start) the stand-in server; call serve_forever() on the result"""
+    handler = make_handler(render_page(load_schedules(schedule_dir)), latency, jitter, error_rate, seed=seed)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = handler.stats
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Zerodha brokerage calculator page")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial delay per page load in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform +/- jitter on the delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of page loads answered with 503")
+    parser.add_argument("--schedule-dir", default=None, help="directory with calibrated fee schedules")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.jitter, args.error_rate, args.schedule_dir, args.seed)
+    print(f"Serving the calculator stand-in on http://{args.host}:{args.port}/brokerage-calculator/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
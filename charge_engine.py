@@ -0,0 +1,170 @@
+import math
+
+
+def round_half_up(value, decimals=2):
+    """Round the way the calculator page does (JavaScript Math.round / toFixed), not banker's rounding"""
+    multiplier = 10 ** decimals
+    return math.floor(value * multiplier + 0.5 + 1e-9) / multiplier
+
+
+def round_half_even(value, decimals):
+    """
+    np.round for one value: scale, round half to even, unscale. round(value, decimals) rounds the exact decimal
+    value of the float instead and disagrees with np.round on a few values.
+    """
+    multiplier = 10 ** decimals
+    return round(value * multiplier) / multiplier
+
+
+def order_brokerage(schedule, leg_turnover):
+    """Brokerage for one executed order: flat cap, percentage, or the lower of the two"""
+    if leg_turnover <= 0:
+        return 0.0
+    rate = schedule['brokerage_rate']
+    cap = schedule['brokerage_cap']
+    if rate is None:
+        return cap
+    if cap is None:
+        return rate * leg_turnover
+    return min(rate * leg_turnover, cap)
+
+
+def compute_charges(schedule, lot_size, total_lot_size, buy_value, sell_value):
+    """
+    Compute the charges for one trade from a fee schedule instead of scraping the calculator.
+    Returns a dict with the same keys as calculate_brokerage in the brockerage_*.py scripts.
+    """
+    buy_turnover = buy_value * total_lot_size
+    sell_turnover = sell_value * total_lot_size
+    total_turnover = buy_turnover + sell_turnover
+
+    brokerage = round_half_up(order_brokerage(schedule, buy_turnover) + order_brokerage(schedule, sell_turnover))
+    stt = round_half_up(schedule['stt_buy_rate'] * buy_turnover + schedule['stt_sell_rate'] * sell_turnover,
+                        schedule['stt_decimals'])
+    # The exchange charge shown includes the IPFT levy, each rounded separately by the calculator
+    etc = round_half_up(round_half_up(schedule['exchange_rate'] * total_turnover)
+                        + round_half_up(schedule['ipft_rate'] * total_turnover))
+    sebi = round_half_up(schedule['sebi_rate'] * total_turnover)
+    # GST is levied on brokerage, exchange and SEBI charges
+    gst = round_half_up(schedule['gst_rate'] * (brokerage + etc + sebi))
+    stamp = round_half_up(schedule['stamp_rate'] * buy_turnover, schedule['stamp_decimals'])
+    total = round_half_up(brokerage + stt + etc + gst + sebi + stamp)
+    break_even = round_half_up(total / total_lot_size) if total_lot_size else 0.0
+
+    # Rounded like compute_charges_arrays so both engines agree on every trade
+    brokerage_percentage = round_half_even(total / total_turnover * 100, 3) if total_turnover else 0.0
+
+    return {
+        "BROKERAGE": brokerage,
+        "STT_TOTAL": stt,
+        "EXCHANGE_TXN_Charge": etc,
+        "GST": gst,
+        "SEBI_CHARGES": sebi,
+        "STAMP DUTY": stamp,
+        "TOTAL TAX AND CHARGES": total,
+        "POINTS TO BREAKEVEN": break_even,
+        "TOTAL BROKERAGE": total,
+        "BROKERAGE %": f"{brokerage_percentage}%",
+    }
+
+
+def round_half_up_array(values, decimals=2):
+    import numpy as np
+    multiplier = 10 ** decimals
+    return np.floor(values * multiplier + 0.5 + 1e-9) / multiplier
+
+
+def order_brokerage_array(schedule, leg_turnover):
+    import numpy as np
+    rate = schedule['brokerage_rate']
+    cap = schedule['brokerage_cap']
+    if rate is None:
+        brokerage = np.full(leg_turnover.shape, cap, dtype=float)
+    elif cap is None:
+        brokerage = rate * leg_turnover
+    else:
+        brokerage = np.minimum(rate * leg_turnover, cap)
+    return np.where(leg_turnover > 0, brokerage, 0.0)
+
+
+def compute_charges_arrays(schedule, total_lot_size, buy_value, sell_value):
+    """
+    Vectorized compute_charges over NumPy arrays of trades of one segment.
+    Returns a dict of float arrays keyed like compute_charges, with BROKERAGE % as a number.
+    """
+    # NumPy is imported on first use so the scalar path stays cheap to import
+    import numpy as np
+
+    total_lot_size = np.asarray(total_lot_size, dtype=float)
+    buy_turnover = np.asarray(buy_value, dtype=float) * total_lot_size
+    sell_turnover = np.asarray(sell_value, dtype=float) * total_lot_size
+    total_turnover = buy_turnover + sell_turnover
+
+    brokerage = round_half_up_array(order_brokerage_array(schedule, buy_turnover)
+                                    + order_brokerage_array(schedule, sell_turnover))
+    stt = round_half_up_array(schedule['stt_buy_rate'] * buy_turnover + schedule['stt_sell_rate'] * sell_turnover,
+                              schedule['stt_decimals'])
+    etc = round_half_up_array(round_half_up_array(schedule['exchange_rate'] * total_turnover)
+                              + round_half_up_array(schedule['ipft_rate'] * total_turnover))
+    sebi = round_half_up_array(schedule['sebi_rate'] * total_turnover)
+    gst = round_half_up_array(schedule['gst_rate'] * (brokerage + etc + sebi))
+    stamp = round_half_up_array(schedule['stamp_rate'] * buy_turnover, schedule['stamp_decimals'])
+    total = round_half_up_array(brokerage + stt + etc + gst + sebi + stamp)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        break_even = np.where(total_lot_size != 0, round_half_up_array(total / total_lot_size), 0.0)
+        brokerage_percentage = np.where(total_turnover != 0, np.round(total / total_turnover * 100, 3), 0.0)
+
+    return {
+        "BROKERAGE": brokerage,
+        "STT_TOTAL": stt,
+        "EXCHANGE_TXN_Charge": etc,
+        "GST": gst,
+        "SEBI_CHARGES": sebi,
+        "STAMP DUTY": stamp,
+        "TOTAL TAX AND CHARGES": total,
+        "POINTS TO BREAKEVEN": break_even,
+        "TOTAL BROKERAGE": total,
+        "BROKERAGE %": brokerage_percentage,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import numpy as np
+
+    from fee_schedule import DEFAULT_FEE_SCHEDULES
+
+    # The scalar engine (one trade at a time, e.g. calc_service below its vector threshold) must give the same
+    # numbers as the vectorized one
+    rng = np.random.default_rng(0)
+    trades = 200_000
+    quantity = rng.integers(1, 5000, trades).astype(float)
+    buy_value = np.round(rng.uniform(0.05, 5000, trades), 2)
+    sell_value = np.round(rng.uniform(0.05, 5000, trades), 2)
+    sell_value[::7] = 0.0  # open positions: one leg only
+
+    failures = 0
+    # Random trades rarely land on a rounding tie of BROKERAGE %; check the rounding itself on ties
+    ties = np.round(rng.uniform(0, 5, trades), 3) + 0.0005
+    mismatches = int(np.count_nonzero(np.array([round_half_even(value, 3) for value in ties.tolist()])
+                                      != np.round(ties, 3)))
+    if mismatches:
+        failures += 1
+        print(f"round_half_even: {mismatches} mismatches with np.round")
+    for segment, schedule in DEFAULT_FEE_SCHEDULES.items():
+        expected = compute_charges_arrays(schedule, quantity, buy_value, sell_value)
+        rows = [compute_charges(schedule, q, q, b, s) for q, b, s in zip(quantity.tolist(), buy_value.tolist(),
+                                                                         sell_value.tolist())]
+        for column, values in expected.items():
+            if column == "BROKERAGE %":
+                scalar = np.array([float(row[column].rstrip('%')) for row in rows])
+            else:
+                scalar = np.array([row[column] for row in rows])
+            mismatches = int(np.count_nonzero(scalar != values))
+            if mismatches:
+                failures += 1
+                print(f"{segment}: {mismatches} mismatches in {column}")
+    if failures:
+        sys.exit(1)
+    print(f"compute_charges identical to compute_charges_arrays on {trades} trades per segment")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Optional Numba-compiled charge kernel.
+
+charges_kernel evaluates the charge_engine formulas trade by trade over typed arrays, which is where order-level
+caps or multi-leg grouping can be added without falling back to interpreted Python. With Numba installed it is
+compiled on first use (nogil, cached in __pycache__ for later runs); without it compute_charges_jit falls back to
+the NumPy engine, compute_charges_arrays, which gives identical results.
+
+Importing this module imports Numba when it is installed (~0.3s), so callers import it only for inputs large
+enough to repay that.
+
+    python charge_kernels.py            # check the kernel against the NumPy engine and time both
+"""
+import math
+
+from charge_engine import compute_charges_arrays
+
+try:
+    import numba
+    jit = numba.njit(nogil=True, cache=True)
+except ImportError:
+    numba = None
+
+    def jit(function):
+        return function
+
+# Order of the rows in the kernel's output array
+KERNEL_COLUMNS = ["BROKERAGE", "STT_TOTAL", "EXCHANGE_TXN_Charge", "GST", "SEBI_CHARGES", "STAMP DUTY",
+                  "TOTAL TAX AND CHARGES", "POINTS TO BREAKEVEN", "BROKERAGE %"]
+
+# Brokerage modes in the kernel parameters
+FLAT, RATE, RATE_CAPPED = 0.0, 1.0, 2.0
+
+
+def kernel_params(schedule):
+    """A fee schedule as the float64 parameter vector the kernel takes"""
+    import numpy as np
+
+    rate = schedule['brokerage_rate']
+    cap = schedule['brokerage_cap']
+    mode = FLAT if rate is None else RATE if cap is None else RATE_CAPPED
+    return np.array([mode, rate or 0.0, cap or 0.0, schedule['stt_buy_rate'], schedule['stt_sell_rate'],
+                     schedule['exchange_rate'], schedule['ipft_rate'], schedule['sebi_rate'], schedule['gst_rate'],
+                     schedule['stamp_rate'], 10.0 ** schedule['stt_decimals'], 10.0 ** schedule['stamp_decimals']])
+
+
+@jit
+def round_half_up(value, multiplier):
+    # Same operations as charge_engine.round_half_up_array, so results match bit for bit
+    return math.floor(value * multiplier + 0.5 + 1e-9) / multiplier
+
+
+@jit
+def order_brokerage(params, leg_turnover):
+    if leg_turnover <= 0:
+        return 0.0
+    if params[0] == FLAT:
+        return params[2]
+    if params[0] == RATE:
+        return params[1] * leg_turnover
+    return min(params[1] * leg_turnover, params[2])
+
+
+@jit
+def charges_kernel(params, total_lot_size, buy_value, sell_value, out):
+    """Write the charges of every trade into out (len(KERNEL_COLUMNS) x n, each charge contiguous)"""
+    for i in range(total_lot_size.shape[0]):
+        quantity = total_lot_size[i]
+        buy_turnover = buy_value[i] * quantity
+        sell_turnover = sell_value[i] * quantity
+        total_turnover = buy_turnover + sell_turnover
+
+        brokerage = round_half_up(order_brokerage(params, buy_turnover) + order_brokerage(params, sell_turnover),
+                                  100.0)
+        stt = round_half_up(params[3] * buy_turnover + params[4] * sell_turnover, params[10])
+        etc = round_half_up(round_half_up(params[5] * total_turnover, 100.0)
+                            + round_half_up(params[6] * total_turnover, 100.0), 100.0)
+        sebi = round_half_up(params[7] * total_turnover, 100.0)
+        gst = round_half_up(params[8] * (brokerage + etc + sebi), 100.0)
+        stamp = round_half_up(params[9] * buy_turnover, params[11])
+        total = round_half_up(brokerage + stt + etc + gst + sebi + stamp, 100.0)
+
+        out[0, i] = brokerage
+        out[1, i] = stt
+        out[2, i] = etc
+        out[3, i] = gst
+        out[4, i] = sebi
+        out[5, i] = stamp
+        out[6, i] = total
+        out[7, i] = round_half_up(total / quantity, 100.0) if quantity != 0 else 0.0
+        # np.round(x, 3): scale, round half to even, unscale
+        out[8, i] = round(total / total_turnover * 100 * 1000.0) / 1000.0 if total_turnover != 0 else 0.0
+
+
+def run_kernel(kernel, schedule, total_lot_size, buy_value, sell_value):
+    """Charges from a kernel as a dict of arrays keyed like compute_charges_arrays"""
+    import numpy as np
+
+    total_lot_size = np.ascontiguousarray(total_lot_size, dtype=float)
+    out = np.empty((len(KERNEL_COLUMNS), len(total_lot_size)))
+    kernel(kernel_params(schedule), total_lot_size, np.ascontiguousarray(buy_value, dtype=float),
+           np.ascontiguousarray(sell_value, dtype=float), out)
+    charges = {column: out[index] for index, column in enumerate(KERNEL_COLUMNS[:8])}
+    charges["TOTAL BROKERAGE"] = out[6]
+    charges["BROKERAGE %"] = out[8]
+    return charges
+
+
+def compute_charges_jit(schedule, total_lot_size, buy_value, sell_value):
+    """compute_charges_arrays through the compiled kernel, or through the NumPy engine without Numba"""
+    if numba is None:
+        return compute_charges_arrays(schedule, total_lot_size, buy_value, sell_value)
+    return run_kernel(charges_kernel, schedule, total_lot_size, buy_value, sell_value)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import numpy as np
+
+    from fee_schedule import DEFAULT_FEE_SCHEDULES
+
+    rng = np.random.default_rng(0)
+    trades = 2_000_000
+    quantity = rng.integers(1, 5000, trades).astype(float)
+    buy_value = np.round(rng.uniform(0.05, 5000, trades), 2)
+    sell_value = np.round(rng.uniform(0.05, 5000, trades), 2)
+    sell_value[::7] = 0.0  # open positions: one leg only
+
+    kernel = charges_kernel if numba else None
+    python_kernel = getattr(charges_kernel, 'py_func', charges_kernel)
+    failures = 0
+    for segment, schedule in DEFAULT_FEE_SCHEDULES.items():
+        start = time.perf_counter()
+        expected = compute_charges_arrays(schedule, quantity, buy_value, sell_value)
+        numpy_rate = trades / (time.perf_counter() - start)
+
+        # The uncompiled kernel is checked on a slice; it is the same code Numba compiles
+        sample = slice(0, 20000)
+        candidates = [("python kernel", run_kernel(python_kernel, schedule, quantity[sample], buy_value[sample],
+                                                    sell_value[sample]), sample)]
+        line = f"{segment:9s} numpy {numpy_rate / 1e6:6.1f}M trades/s"
+        if kernel is not None:
+            run_kernel(kernel, schedule, quantity[:10], buy_value[:10], sell_value[:10])  # compile
+            start = time.perf_counter()
+            candidates.append(("numba kernel", run_kernel(kernel, schedule, quantity, buy_value, sell_value),
+                               slice(None)))
+            line += f"  numba {trades / (time.perf_counter() - start) / 1e6:6.1f}M trades/s"
+        print(line)
+
+        for name, charges, rows in candidates:
+            for column, values in expected.items():
+                mismatches = int(np.count_nonzero(charges[column] != values[rows]))
+                if mismatches:
+                    failures += 1
+                    print(f"  {name}: {mismatches} mismatches in {column}")
+    if kernel is None:
+        print("Numba is not installed; only the Python kernel was checked")
+    if failures:
+        sys.exit(1)
+    print("Kernel results identical to the NumPy engine")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the entry points, based on `python -X importtime`.
+
+Each module is imported in a fresh interpreter. The check fails (exit code 1) if its cumulative import time
+exceeds the budget or if it pulls in a heavy dependency that should only load on the code path needing it.
+
+    python check_import_time.py              # default budget
+    python check_import_time.py --budget-ms 80
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+MODULES = [
+    'brockerage_foptions',
+    'brockerage_ffutures',
+    'brockerage_del_equity',
+    'brockerage_intra_equity',
+    'brokerage_calculator',
+    'calc_service',
+    'stream_fills',
+    'debug_app',
+    'arrow_io',
+    'polars_backend',
+    'trade_file',
+    'instrument_master',
+    'input_validation',
+    'partitioned_output',
+]
+
+# Loaded lazily: selenium when scraping, tkinter for the GUI, pandas/numpy when computing
+HEAVY_MODULES = ('selenium', 'pandas', 'numpy', 'tkinter', 'openpyxl', 'pyarrow', 'polars')
+
+
+def measure(module):
+    """Return (cumulative import time in ms, set of top-level packages imported) for one module"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    cumulative_us = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        imported.add(name.split('.')[0])
+        if name == module:
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if entry points exceed their import-time budget")
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of N runs to reduce noise")
+    args = parser.parse_args()
+
+    failures = []
+    for module in MODULES:
+        runs = [measure(module) for _ in range(args.repeat)]
+        best_ms = min(ms for ms, _ in runs)
+        heavy = sorted(set(HEAVY_MODULES) & runs[0][1])
+        status = "ok"
+        if best_ms > args.budget_ms:
+            status = f"over budget ({args.budget_ms:.0f}ms)"
+            failures.append(module)
+        if heavy:
+            status = f"imports {', '.join(heavy)} at load"
+            failures.append(module)
+        print(f"{module:28s} {best_ms:8.1f}ms  {status}")
+
+    if failures:
+        print(f"\nImport-time budget exceeded by: {', '.join(sorted(set(failures)))}")
+        sys.exit(1)
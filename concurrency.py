@@ -0,0 +1,144 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def cpu_load_per_core():
+    """Return the 1 minute load average divided by the number of cores, or None where unavailable (Windows)"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+def free_memory_mb():
+    """Return the available system memory in MB, or None if it cannot be determined"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024 * 1024)
+    except ImportError:
+        pass
+
+    # Linux fallback when psutil is not installed
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class AdaptiveConcurrencyController:
+    """
+    AIMD controller for the number of rows processed concurrently.
+
+    After every round (as many completed rows as the current limit) the controller looks at the
+    observed per-row latency, the error rate, the CPU load and the free memory. If everything is
+    healthy the limit grows by one, otherwise it is multiplied by the decrease factor. The limit
+    always stays within [min_limit, max_limit]. Every decision is printed with the numbers behind it.
+    """
+
+    def __init__(self, min_limit=1, max_limit=None, initial_limit=5, latency_tolerance=1.5,
+                 max_error_rate=0.2, max_load_per_core=1.0, min_free_memory_mb=500, decrease_factor=0.5):
+        if max_limit is None:
+            # Every in-flight row drives its own headless browser, so stay close to the core count
+            max_limit = max(2, (os.cpu_count() or 2) * 2)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.max_error_rate = max_error_rate
+        self.max_load_per_core = max_load_per_core
+        self.min_free_memory_mb = min_free_memory_mb
+        self.decrease_factor = decrease_factor
+
+        self.baseline_latency = None
+        self.decisions = []
+        self._latencies = []
+        self._errors = 0
+
+    def record(self, latency, ok=True):
+        """Record one completed row and adjust the limit at the end of each round"""
+        self._latencies.append(latency)
+        if not ok:
+            self._errors += 1
+        if len(self._latencies) >= self.limit:
+            self._adjust()
+
+    def _adjust(self):
+        latencies = sorted(self._latencies)
+        median_latency = latencies[len(latencies) // 2]
+        error_rate = self._errors / len(latencies)
+        load = cpu_load_per_core()
+        free_mb = free_memory_mb()
+        self._latencies = []
+        self._errors = 0
+
+        # The best median seen so far is the latency of an unloaded pool
+        if self.baseline_latency is None or median_latency < self.baseline_latency:
+            self.baseline_latency = median_latency
+
+        if error_rate > self.max_error_rate:
+            reason = f"error rate {error_rate:.0%} above {self.max_error_rate:.0%}"
+        elif free_mb is not None and free_mb < self.min_free_memory_mb:
+            reason = f"free memory {free_mb:.0f}MB below {self.min_free_memory_mb}MB"
+        elif load is not None and load > self.max_load_per_core:
+            reason = f"load {load:.2f}/core above {self.max_load_per_core:.2f}"
+        elif median_latency > self.baseline_latency * self.latency_tolerance:
+            reason = f"latency {median_latency:.2f}s above {self.latency_tolerance}x baseline {self.baseline_latency:.2f}s"
+        else:
+            reason = None
+
+        old_limit = self.limit
+        if reason:
+            self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+            reason = "healthy"
+
+        load_text = f"{load:.2f}/core" if load is not None else "n/a"
+        free_text = f"{free_mb:.0f}MB" if free_mb is not None else "n/a"
+        print(f"Concurrency limit {old_limit} -> {self.limit} ({reason}; p50 latency {median_latency:.2f}s, "
+              f"errors {error_rate:.0%}, load {load_text}, free memory {free_text})")
+        self.decisions.append({
+            'old_limit': old_limit,
+            'new_limit': self.limit,
+            'reason': reason,
+            'median_latency': median_latency,
+            'error_rate': error_rate,
+            'load_per_core': load,
+            'free_memory_mb': free_mb,
+        })
+
+
+def run_adaptive(func, items, controller, on_result):
+    """
+    Run func(arg) for every (key, arg) in items, keeping controller.limit calls in flight.
+    on_result(key, future) is called from the calling thread as each call completes.
+    """
+    items = iter(items)
+    pending = {}
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=controller.max_limit) as executor:
+        while True:
+            # Top up to the current limit; the pool is sized for max_limit so nothing queues
+            while not exhausted and len(pending) < controller.limit:
+                try:
+                    key, arg = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, arg)] = (key, time.monotonic())
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, started = pending.pop(future)
+                # The segment scripts' calculate_brokerage reports a failed scrape by returning None
+                ok = future.exception() is None and future.result() is not None
+                controller.record(time.monotonic() - started, ok)
+                on_result(key, future)
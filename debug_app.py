@@ -2,9 +2,6 @@
 import os
 import sys
 import platform
-import tkinter as tk
-from tkinter import messagebox, filedialog
-import pandas as pd
 import datetime
 import shutil
 
@@ -104,6 +101,10 @@ def debug_info():
     return "\n".join(info)
 
 def main():
+    # Tk is only needed for the window, not for debug_info()
+    import tkinter as tk
+    from tkinter import messagebox
+
     # Create the main window
     root = tk.Tk()
     root.title("Brokerage Calculator Debug")
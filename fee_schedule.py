@@ -0,0 +1,278 @@
+import os
+import json
+import random
+from datetime import datetime
+
+from charge_engine import compute_charges, round_half_up
+
+SEGMENTS = ('options', 'futures', 'delivery', 'intraday')
+
+# Published Zerodha rates at the time of writing. Only used as a starting point (e.g. by the local
+# stand-in server); calibrated schedules in FEE_SCHEDULES/ always take precedence.
+DEFAULT_FEE_SCHEDULES = {
+    'options': {
+        'brokerage_rate': None, 'brokerage_cap': 20.0,
+        'stt_buy_rate': 0.0, 'stt_sell_rate': 0.001,
+        'exchange_rate': 0.0003503, 'ipft_rate': 0.000005, 'sebi_rate': 0.000001,
+        'stamp_rate': 0.00003, 'gst_rate': 0.18,
+        'stt_decimals': 0, 'stamp_decimals': 0,
+    },
+    'futures': {
+        'brokerage_rate': 0.0003, 'brokerage_cap': 20.0,
+        'stt_buy_rate': 0.0, 'stt_sell_rate': 0.0002,
+        'exchange_rate': 0.0000173, 'ipft_rate': 0.000001, 'sebi_rate': 0.000001,
+        'stamp_rate': 0.00002, 'gst_rate': 0.18,
+        'stt_decimals': 0, 'stamp_decimals': 0,
+    },
+    'delivery': {
+        'brokerage_rate': 0.0, 'brokerage_cap': None,
+        'stt_buy_rate': 0.001, 'stt_sell_rate': 0.001,
+        'exchange_rate': 0.0000297, 'ipft_rate': 0.000001, 'sebi_rate': 0.000001,
+        'stamp_rate': 0.00015, 'gst_rate': 0.18,
+        'stt_decimals': 0, 'stamp_decimals': 0,
+    },
+    'intraday': {
+        'brokerage_rate': 0.0003, 'brokerage_cap': 20.0,
+        'stt_buy_rate': 0.0, 'stt_sell_rate': 0.00025,
+        'exchange_rate': 0.0000297, 'ipft_rate': 0.000001, 'sebi_rate': 0.000001,
+        'stamp_rate': 0.00003, 'gst_rate': 0.18,
+        'stt_decimals': 0, 'stamp_decimals': 0,
+    },
+}
+
+# Probe inputs as (buy_value, sell_value, quantity).
+# Small probes keep every leg below Rs. 66,666 so a 0.03% brokerage stays under the Rs. 20 cap.
+SMALL_PROBES = [
+    (100, 110, 100), (250, 230, 200), (45.5, 60.25, 300), (80, 95, 500),
+    (12.35, 9.8, 1000), (150, 180, 50), (33.3, 41.7, 750), (500, 520, 100),
+]
+# Large probes push every leg past the cap and make the rounding of the displayed values negligible
+LARGE_PROBES = [
+    (2500, 2600, 5000), (1200, 1000, 10000), (800, 1100, 15000), (3000, 2000, 4000), (450, 900, 25000),
+    (1500, 1550, 8000), (950, 700, 12000), (2200, 2400, 6000), (640, 810, 18000), (1800, 1300, 7000),
+]
+
+# IPFT levies seen on NSE (Rs. 10 per crore, or 0.0005% on option premium); the calibration picks the one
+# that, together with the exchange rate, reproduces the separately rounded values on the page. Ties go to
+# the earlier candidate, so the common Rs. 10 per crore comes first.
+IPFT_CANDIDATES = (0.000001, 0.000005, 0.00001, 0.0)
+
+SCHEDULE_COMPONENTS = {
+    'BROKERAGE': 2,
+    'STT_TOTAL': 'stt_decimals',
+    'EXCHANGE_TXN_Charge': 2,
+    'GST': 2,
+    'SEBI_CHARGES': 2,
+    'STAMP DUTY': 'stamp_decimals',
+}
+
+
+class CalibrationError(Exception):
+    """Raised when a fitted fee schedule does not reproduce freshly scraped values"""
+
+
+def default_schedule_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "FEE_SCHEDULES")
+
+
+def clean_value(val):
+    return float(str(val).replace('₹', '').replace(',', ''))
+
+
+def round_significant(value, digits=4):
+    """Fitted rates are published with a handful of significant digits; snap to them"""
+    if abs(value) < 1e-9:
+        return 0.0
+    return float(f"{value:.{digits}g}")
+
+
+def _fit_through_origin(xs, ys):
+    """Least squares slope of y = k * x"""
+    denominator = sum(x * x for x in xs)
+    return sum(x * y for x, y in zip(xs, ys)) / denominator if denominator else 0.0
+
+
+def _fit_two_rates(buys, sells, ys):
+    """Least squares for y = a * buy + b * sell (normal equations of a 2x2 system)"""
+    sbb = sum(b * b for b in buys)
+    sss = sum(s * s for s in sells)
+    sbs = sum(b * s for b, s in zip(buys, sells))
+    sby = sum(b * y for b, y in zip(buys, ys))
+    ssy = sum(s * y for s, y in zip(sells, ys))
+    determinant = sbb * sss - sbs * sbs
+    if not determinant:
+        return 0.0, _fit_through_origin([b + s for b, s in zip(buys, sells)], ys)
+    return (sby * sss - ssy * sbs) / determinant, (ssy * sbb - sby * sbs) / determinant
+
+
+def _decimals(values):
+    """Whole-rupee rounding if every observed value is a whole number, paise otherwise"""
+    if any(values) and all(float(v).is_integer() for v in values):
+        return 0
+    return 2
+
+
+def scrape_probe(scrape, buy_value, sell_value, quantity):
+    """Scrape one probe and return its charge components as floats"""
+    scraped = scrape(quantity, quantity, buy_value, sell_value)
+    if not scraped:
+        raise CalibrationError(f"Scrape failed for probe buy={buy_value} sell={sell_value} qty={quantity}")
+    return {key: clean_value(scraped[key]) for key in SCHEDULE_COMPONENTS}
+
+
+def fit_fee_schedule(segment, small_observations, large_observations):
+    """
+    Fit the fee parameters of one segment.
+    Each observation is ((buy_value, sell_value, quantity), components) as returned by scrape_probe.
+    """
+    def turnovers(observations):
+        return ([buy * qty for (buy, sell, qty), _ in observations],
+                [sell * qty for (buy, sell, qty), _ in observations])
+
+    large_buys, large_sells = turnovers(large_observations)
+    large_totals = [b + s for b, s in zip(large_buys, large_sells)]
+    small_buys, small_sells = turnovers(small_observations)
+
+    def large(key):
+        return [values[key] for _, values in large_observations]
+
+    all_observations = small_observations + large_observations
+    all_buys, all_sells = turnovers(all_observations)
+    all_totals = [b + s for b, s in zip(all_buys, all_sells)]
+    stt_decimals = _decimals([values['STT_TOTAL'] for _, values in all_observations])
+    stamp_decimals = _decimals([values['STAMP DUTY'] for _, values in all_observations])
+
+    # Brokerage cap: on large probes both orders are capped
+    capped = sorted(value / 2 for value in large('BROKERAGE'))
+    cap = capped[len(capped) // 2]
+    small_brokerage = [values['BROKERAGE'] for _, values in small_observations]
+    if not cap:
+        brokerage_rate, brokerage_cap = 0.0, None
+    elif all(abs(value - 2 * cap) < 0.011 for value in small_brokerage):
+        # Flat fee per executed order regardless of size (options)
+        brokerage_rate, brokerage_cap = None, round(cap, 2)
+    else:
+        small_totals = [b + s for b, s in zip(small_buys, small_sells)]
+        brokerage_rate = round_significant(_fit_through_origin(small_totals, small_brokerage))
+        brokerage_cap = round(cap, 2)
+
+    stt_buy_rate, stt_sell_rate = _fit_two_rates(large_buys, large_sells, large('STT_TOTAL'))
+
+    # Split the combined exchange rate into exchange charge and IPFT
+    combined_rate = _fit_through_origin(large_totals, large('EXCHANGE_TXN_Charge'))
+    exchange_values = [values['EXCHANGE_TXN_Charge'] for _, values in all_observations]
+
+    def exchange_error(rates):
+        return round(sum(abs(round_half_up(round_half_up(rates[0] * total) + round_half_up(rates[1] * total)) - value)
+                         for total, value in zip(all_totals, exchange_values)), 6)
+
+    exchange_rate, ipft_rate = min(((round_significant(combined_rate - ipft), ipft) for ipft in IPFT_CANDIDATES),
+                                   key=exchange_error)
+
+    # Whole-rupee values carry less precision, so fewer significant digits are trustworthy
+    stt_digits = 3 if stt_decimals == 0 else 4
+    stamp_digits = 3 if stamp_decimals == 0 else 4
+    gst_base = [values['BROKERAGE'] + values['EXCHANGE_TXN_Charge'] + values['SEBI_CHARGES']
+                for _, values in all_observations]
+
+    return {
+        'segment': segment,
+        'brokerage_rate': brokerage_rate,
+        'brokerage_cap': brokerage_cap,
+        'stt_buy_rate': round_significant(stt_buy_rate, stt_digits),
+        'stt_sell_rate': round_significant(stt_sell_rate, stt_digits),
+        'exchange_rate': exchange_rate,
+        'ipft_rate': ipft_rate,
+        'sebi_rate': round_significant(_fit_through_origin(large_totals, large('SEBI_CHARGES'))),
+        'stamp_rate': round_significant(_fit_through_origin(large_buys, large('STAMP DUTY')), stamp_digits),
+        'gst_rate': round_significant(_fit_through_origin(gst_base, [values['GST'] for _, values in all_observations])),
+        'stt_decimals': stt_decimals,
+        'stamp_decimals': stamp_decimals,
+    }
+
+
+def verify_fee_schedule(schedule, scrape, probes=3, seed=None):
+    """
+    Scrape a few fresh random probes and compare them with the local computation.
+    Raises CalibrationError on any mismatch.
+    """
+    rng = random.Random(seed)
+    label = f"v{schedule['version']}" if 'version' in schedule else "candidate"
+    mismatches = []
+    for _ in range(probes):
+        buy_value = round(rng.uniform(10, 3000), 2)
+        sell_value = round(rng.uniform(10, 3000), 2)
+        quantity = rng.choice([1, 25, 50, 75, 100, 500, 1000, 5000])
+        scraped = scrape_probe(scrape, buy_value, sell_value, quantity)
+        computed = compute_charges(schedule, quantity, quantity, buy_value, sell_value)
+        for key, decimals in SCHEDULE_COMPONENTS.items():
+            if isinstance(decimals, str):
+                decimals = schedule[decimals]
+            # The computed value, rounded as the page displays it, must be the scraped value exactly
+            if abs(scraped[key] - round_half_up(computed[key], decimals)) > 1e-9:
+                mismatches.append(f"{key} buy={buy_value} sell={sell_value} qty={quantity}: "
+                                  f"scraped {scraped[key]}, computed {computed[key]}")
+    if mismatches:
+        raise CalibrationError(f"Fee schedule {label} for {schedule['segment']} "
+                               f"does not match the calculator:\n" + "\n".join(mismatches))
+    print(f"Fee schedule {label} for {schedule['segment']} verified with {probes} fresh probes")
+
+
+def list_fee_schedules(segment, schedule_dir=None):
+    """Return the stored schedule files for a segment, oldest version first"""
+    schedule_dir = schedule_dir or default_schedule_dir()
+    if not os.path.isdir(schedule_dir):
+        return []
+    files = [f for f in os.listdir(schedule_dir) if f.startswith(f"{segment}_v") and f.endswith('.json')]
+    return [os.path.join(schedule_dir, f) for f in sorted(files)]
+
+
+def load_fee_schedule(segment, schedule_dir=None):
+    """Load the latest stored schedule for a segment, or None if it was never calibrated"""
+    files = list_fee_schedules(segment, schedule_dir)
+    if not files:
+        return None
+    with open(files[-1]) as schedule_file:
+        return json.load(schedule_file)
+
+
+def save_fee_schedule(schedule, schedule_dir=None):
+    """Store a schedule as the next version for its segment and return the file path"""
+    schedule_dir = schedule_dir or default_schedule_dir()
+    if not os.path.exists(schedule_dir):
+        os.makedirs(schedule_dir)
+        print(f"Created fee schedule directory: {schedule_dir}")
+
+    schedule['version'] = len(list_fee_schedules(schedule['segment'], schedule_dir)) + 1
+    path = os.path.join(schedule_dir, f"{schedule['segment']}_v{schedule['version']:04d}.json")
+    with open(path, 'w') as schedule_file:
+        json.dump(schedule, schedule_file, indent=2)
+    print(f"Fee schedule saved to {path}")
+    return path
+
+
+def calibrate(segment, scrape, schedule_dir=None, verify_probes=3):
+    """
+    Scrape the designed probe set for a segment, fit its fee parameters, verify them against
+    fresh probes and store the result as a new schedule version.
+    scrape is the segment's calculate_brokerage function.
+    """
+    print(f"Calibrating {segment} fee schedule from {len(SMALL_PROBES) + len(LARGE_PROBES)} probes")
+    small = [(probe, scrape_probe(scrape, *probe)) for probe in SMALL_PROBES]
+    large = [(probe, scrape_probe(scrape, *probe)) for probe in LARGE_PROBES]
+
+    schedule = fit_fee_schedule(segment, small, large)
+    schedule['calibrated_at'] = datetime.now().isoformat(timespec='seconds')
+    schedule['probes'] = len(small) + len(large)
+    verify_fee_schedule(schedule, scrape, verify_probes)
+    save_fee_schedule(schedule, schedule_dir)
+    return schedule
+
+
+def get_fee_schedule(segment, scrape, schedule_dir=None):
+    """Return today's schedule for a segment, calibrating a new version if there is none yet"""
+    schedule = load_fee_schedule(segment, schedule_dir)
+    if schedule and schedule['calibrated_at'][:10] == datetime.now().date().isoformat():
+        print(f"Using fee schedule v{schedule['version']} for {segment} calibrated at {schedule['calibrated_at']}")
+        return schedule
+    return calibrate(segment, scrape, schedule_dir)
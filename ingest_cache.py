@@ -0,0 +1,150 @@
+import os
+import json
+import threading
+import importlib.util
+
+from input_archive import default_input_dir, input_digest
+
+# Parsed inputs are cached as INPUT/cache/<sha256 of the input file>.parquet, so a workbook is only parsed
+# by the (slow) Excel reader the first time its content is seen. The cache is used by the file pipelines
+# (process_input_file, batch runs, the watch folder), not by read_input unless asked.
+CACHE_DIR = "cache"
+
+# Least recently used entries are removed once the cache grows past this (BROKERAGE_INGEST_CACHE_MB)
+DEFAULT_CACHE_MB = 1024
+
+
+def default_cache_dir():
+    return os.path.join(default_input_dir(), CACHE_DIR)
+
+
+def cache_enabled():
+    """Whether the file pipelines use the ingest cache: BROKERAGE_INGEST_CACHE, on unless "0", and pyarrow"""
+    return os.environ.get("BROKERAGE_INGEST_CACHE", "1") != "0" and importlib.util.find_spec('pyarrow') is not None
+
+
+def excel_engine():
+    """Use the Rust calamine reader when python-calamine is installed, otherwise pandas' default (openpyxl)"""
+    return 'calamine' if importlib.util.find_spec('python_calamine') else None
+
+
+def read_source(input_file, sheet_name=0):
+    """
+    Parse an input file. sheet_name is passed to pd.read_excel: 0 for the first sheet, None for a dict of all
+    sheets in workbook order. A CSV is a single sheet named after the file.
+    """
+    import pandas as pd
+
+    if input_file.lower().endswith('.csv'):
+        df = pd.read_csv(input_file)
+        return df if sheet_name is not None else {os.path.splitext(os.path.basename(input_file))[0]: df}
+    engine = excel_engine()
+    if engine:
+        try:
+            return pd.read_excel(input_file, sheet_name=sheet_name, engine=engine)
+        except (ValueError, ImportError) as exc:
+            # pandas older than 2.2 does not know the calamine engine
+            print(f"Excel engine {engine} unavailable ({exc}), falling back to the default reader")
+    return pd.read_excel(input_file, sheet_name=sheet_name)
+
+
+def _write_cached(df, cache_path):
+    # Write under a temporary name so a concurrent reader never sees a half-written file
+    partial_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.partial"
+    try:
+        df.to_parquet(partial_path, index=False)
+        os.replace(partial_path, cache_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def load_cached(digest, cache_dir=None):
+    """The cached DataFrame for a content digest, or None"""
+    import pandas as pd
+
+    cache_dir = cache_dir or default_cache_dir()
+    cache_path = os.path.join(cache_dir, f"{digest}.parquet")
+    if not os.path.exists(cache_path) or importlib.util.find_spec('pyarrow') is None:
+        return None
+    try:
+        df = pd.read_parquet(cache_path)
+    except Exception as exc:
+        print(f"Ignoring unreadable ingest cache {cache_path}: {exc}")
+        os.remove(cache_path)
+        return None
+    # The modification time orders entries for pruning, so a hit counts as a use
+    os.utime(cache_path)
+    return df
+
+
+def prune_cache(cache_dir=None, max_bytes=None):
+    """Remove the least recently used cache entries until the cache is at most max_bytes"""
+    cache_dir = cache_dir or default_cache_dir()
+    if max_bytes is None:
+        max_bytes = int(os.environ.get("BROKERAGE_INGEST_CACHE_MB", DEFAULT_CACHE_MB)) * 1024 * 1024
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and not entry.name.endswith('.partial'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # removed by a concurrent run
+        total -= size
+
+
+def store_cached(df, digest, cache_dir=None):
+    """Cache a DataFrame under a content digest; returns the cache path, or None if it could not be cached"""
+    if importlib.util.find_spec('pyarrow') is None:
+        return None
+    cache_dir = cache_dir or default_cache_dir()
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"{digest}.parquet")
+    try:
+        _write_cached(df, cache_path)
+    except Exception as exc:
+        # e.g. Parquet rejects object columns mixing numbers and text; such inputs are just read again
+        print(f"Not caching {digest} ({exc})")
+        return None
+    prune_cache(cache_dir)
+    return cache_path
+
+
+def read_input_cached(input_file, cache_dir=None):
+    """Load an input file into a DataFrame, served from the ingest cache when its content was read before"""
+    digest = input_digest(input_file)
+    df = load_cached(digest, cache_dir)
+    if df is None:
+        df = read_source(input_file)
+        store_cached(df, digest, cache_dir)
+    return df
+
+
+def read_sheets_cached(input_file, cache_dir=None):
+    """
+    All sheets of a workbook as {sheet name: DataFrame}, parsed in a single read the first time the content is
+    seen. Each sheet is cached on its own, with the sheet names in {digest}.sheets.json.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    digest = input_digest(input_file)
+    names_path = os.path.join(cache_dir, f"{digest}.sheets.json")
+    if os.path.exists(names_path):
+        with open(names_path, encoding='utf-8') as names_file:
+            names = json.load(names_file)
+        sheets = {name: load_cached(f"{digest}.{index}", cache_dir) for index, name in enumerate(names)}
+        if all(df is not None for df in sheets.values()):
+            return sheets
+
+    sheets = read_source(input_file, sheet_name=None)
+    stored = [store_cached(df, f"{digest}.{index}", cache_dir) for index, df in enumerate(sheets.values())]
+    if all(stored):
+        with open(names_path, 'w', encoding='utf-8') as names_file:
+            json.dump(list(sheets), names_file)
+    return sheets
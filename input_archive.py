@@ -0,0 +1,136 @@
+import os
+import json
+import shutil
+import threading
+import hashlib
+from datetime import datetime
+
+# Archived inputs are stored once per distinct content under INPUT/objects/<sha256><ext>;
+# INPUT/manifest.jsonl records every archival (time, original name and path, digest, object).
+OBJECTS_DIR = "objects"
+MANIFEST_NAME = "manifest.jsonl"
+
+# Linux FICLONE ioctl: copy-on-write clone on btrfs/xfs, instant and safe against later edits of the source
+FICLONE = 0x40049409
+
+
+def default_input_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "INPUT")
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, streamed in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as src_file:
+        for chunk in iter(lambda: src_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(input_dir=None):
+    """All manifest entries, oldest first"""
+    manifest_path = os.path.join(input_dir or default_input_dir(), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        return [json.loads(line) for line in manifest_file if line.strip()]
+
+
+def append_manifest(entry, input_dir=None):
+    manifest_path = os.path.join(input_dir or default_input_dir(), MANIFEST_NAME)
+    with open(manifest_path, 'a', encoding='utf-8') as manifest_file:
+        manifest_file.write(json.dumps(entry) + "\n")
+
+
+def _cached_digest(entries, path, stat):
+    """Reuse the digest of an earlier archival of the same, unmodified file instead of re-reading it"""
+    for entry in reversed(entries):
+        if (entry.get('source') == path and entry.get('size') == stat.st_size
+                and entry.get('mtime_ns') == stat.st_mtime_ns):
+            return entry['sha256']
+    return None
+
+
+def input_digest(path, input_dir=None):
+    """SHA-256 of an input file, taken from the manifest when the same unmodified file was archived before"""
+    source = os.path.abspath(path)
+    objects_dir = os.path.join(os.path.abspath(input_dir or default_input_dir()), OBJECTS_DIR)
+    if os.path.dirname(source) == objects_dir:
+        # Archived objects are named by their digest
+        return os.path.splitext(os.path.basename(source))[0]
+    return _cached_digest(read_manifest(input_dir), source, os.stat(source)) or file_digest(source)
+
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def store_object(src, dst, hardlink=False):
+    """
+    Put src at dst as cheaply as the file system allows and return the method used.
+    Tries a reflink first, then (only if hardlink is set) a hard link, then shutil.copyfile, which
+    streams in the kernel (sendfile/copy_file_range on Linux, fcopyfile on macOS).
+    Hard links share the inode with the source, so an input later edited in place would change the archive
+    too; they are therefore opt-in.
+    """
+    try:
+        _reflink(src, dst)
+        return 'reflink'
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def archive_input(input_file, input_dir=None, hardlink=None):
+    """
+    Archive the input file by content and return the path of the archived object.
+    Content that is already archived is not stored again; only a manifest entry is added.
+    hardlink defaults to the BROKERAGE_ARCHIVE_HARDLINK environment variable.
+    """
+    input_dir = input_dir or default_input_dir()
+    objects_dir = os.path.join(input_dir, OBJECTS_DIR)
+    if not os.path.exists(objects_dir):
+        os.makedirs(objects_dir)
+        print(f"Created input directory: {objects_dir}")
+    if hardlink is None:
+        hardlink = os.environ.get("BROKERAGE_ARCHIVE_HARDLINK", "") not in ("", "0")
+
+    source = os.path.abspath(input_file)
+    stat = os.stat(source)
+    entries = read_manifest(input_dir)
+    digest = _cached_digest(entries, source, stat) or file_digest(source)
+
+    extension = os.path.splitext(source)[1].lower()
+    object_path = os.path.join(objects_dir, f"{digest}{extension}")
+    if os.path.exists(object_path):
+        method = 'duplicate'
+        print(f"Input file already archived as: {object_path}")
+    else:
+        # Store under a temporary name first so a crash never leaves a partial object under the digest name
+        partial_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.partial"
+        method = store_object(source, partial_path, hardlink)
+        os.replace(partial_path, object_path)
+        print(f"Archived input file to: {object_path} ({method})")
+
+    append_manifest({
+        'type': 'input',
+        'archived_at': datetime.now().isoformat(timespec='seconds'),
+        'name': os.path.basename(source),
+        'source': source,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': digest,
+        'object': os.path.relpath(object_path, input_dir),
+        'method': method,
+    }, input_dir)
+    return object_path
@@ -0,0 +1,67 @@
+"""
+Up-front validation of input rows, before the parameter file is written or any row is computed.
+
+A missing column fails the whole input at once. Every row is checked with vectorized masks over the whole
+DataFrame: SYMBOL present, numeric columns present and numeric, counts whole numbers, LOT_SIZE and NO_OF_LOTS
+positive, prices not negative, and TOTAL_LOT_SIZE equal to LOT_SIZE * NO_OF_LOTS. Rows that fail any check are
+returned separately with the reasons, for the rejected-rows file.
+"""
+
+# Columns every input must have (after lot sizes are filled from the instrument master)
+REQUIRED_COLUMNS = ['SL_N0', 'SYMBOL', 'LOT_SIZE', 'NO_OF_LOTS', 'TOTAL_LOT_SIZE', 'BUY_VALUE', 'SELL_VALUE']
+INTEGER_COLUMNS = ('SL_N0', 'LOT_SIZE', 'NO_OF_LOTS', 'TOTAL_LOT_SIZE')
+PRICE_COLUMNS = ('BUY_VALUE', 'SELL_VALUE')
+
+
+def check_columns(columns, source="the input"):
+    """Raise ValueError naming the required columns missing from the column names of an input"""
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing columns in {source}: {', '.join(missing)} "
+                         f"(required: {', '.join(REQUIRED_COLUMNS)})")
+
+
+def validate_input(df, source="the input"):
+    """
+    Split an input DataFrame into (valid rows, rejected rows). Valid rows are unchanged; rejected rows get
+    INPUT_ROW (the line in the file, 2 for the first row under the header) and REJECT_REASON.
+    """
+    import numpy as np
+    import pandas as pd
+
+    check_columns(df.columns, source)
+    reasons = np.full(len(df), "", dtype=object)
+
+    def reject(mask, reason):
+        mask = np.asarray(mask, dtype=bool)
+        reasons[mask] = reasons[mask] + f"{reason}; "
+
+    symbols = df['SYMBOL']
+    reject(symbols.isna().to_numpy() | (symbols.astype(str).str.strip() == "").to_numpy(), "missing SYMBOL")
+
+    numbers = {}
+    for column in INTEGER_COLUMNS + PRICE_COLUMNS:
+        missing = df[column].isna().to_numpy()
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        reject(missing, f"missing {column}")
+        reject(~missing & ~np.isfinite(values), f"{column} is not a number")
+        numbers[column] = values
+
+    # The remaining checks only look at numbers, so a missing or non-numeric value is reported once
+    finite = {column: np.isfinite(values) for column, values in numbers.items()}
+    for column in INTEGER_COLUMNS:
+        reject(finite[column] & (numbers[column] != np.floor(numbers[column])), f"{column} is not a whole number")
+    with np.errstate(invalid='ignore'):
+        reject(numbers['LOT_SIZE'] <= 0, "LOT_SIZE is not positive")
+        reject(numbers['NO_OF_LOTS'] <= 0, "NO_OF_LOTS is not positive")
+        for column in PRICE_COLUMNS:
+            reject(numbers[column] < 0, f"{column} is negative")
+    reject(finite['TOTAL_LOT_SIZE'] & finite['LOT_SIZE'] & finite['NO_OF_LOTS']
+           & (numbers['TOTAL_LOT_SIZE'] != numbers['LOT_SIZE'] * numbers['NO_OF_LOTS']),
+           "TOTAL_LOT_SIZE is not LOT_SIZE * NO_OF_LOTS")
+
+    rejected = reasons != ""
+    rejected_df = df[rejected].copy()
+    rejected_df.insert(0, 'INPUT_ROW', np.flatnonzero(rejected) + 2)
+    rejected_df['REJECT_REASON'] = [reason[:-2] for reason in reasons[rejected]]
+    return df[~rejected], rejected_df
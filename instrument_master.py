@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Local instrument master: lot sizes and other metadata per symbol and expiry.
+
+The master is a CSV or Parquet dump in INSTRUMENTS/ (instrument_master.parquet or instrument_master.csv, or the
+file named by BROKERAGE_INSTRUMENT_MASTER) with a SYMBOL and a LOT_SIZE column, an optional EXPIRY column and any
+other metadata columns. On first use it is compiled into a compact NumPy cache next to it
+(instrument_master.cache.npz, rebuilt whenever the dump changes), which loads without pandas. Lookups go
+through dict hash indexes built on load.
+
+With a master in place, input rows only need SYMBOL and NO_OF_LOTS (plus EXPIRY to pick a contract): missing
+LOT_SIZE and TOTAL_LOT_SIZE values are filled in by fill_lot_sizes when the input is read. Without EXPIRY a
+symbol resolves to its nearest expiry on or after today, or to its last one.
+
+    python instrument_master.py [MASTER_FILE]       # compile the cache and time loading and lookups
+"""
+import os
+import sys
+import threading
+from datetime import date, datetime
+
+MASTER_NAMES = ("instrument_master.parquet", "instrument_master.csv")
+CACHE_SUFFIX = ".cache.npz"
+
+# Master loaded per path, with the stat it was loaded from
+_loaded = {}
+_lock = threading.Lock()
+
+
+def default_master_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "INSTRUMENTS")
+
+
+def find_master(master_dir=None):
+    """Path of the instrument master dump, or None if there is none"""
+    path = os.environ.get("BROKERAGE_INSTRUMENT_MASTER")
+    if path:
+        return path
+    master_dir = master_dir or default_master_dir()
+    for name in MASTER_NAMES:
+        path = os.path.join(master_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def cache_path(master_path):
+    return os.path.splitext(master_path)[0] + CACHE_SUFFIX
+
+
+def compile_master(master_path):
+    """Read a master dump and write its compact cache: one array per column, sorted by SYMBOL and EXPIRY"""
+    import numpy as np
+    import pandas as pd
+
+    if master_path.lower().endswith('.parquet'):
+        df = pd.read_parquet(master_path)
+    else:
+        df = pd.read_csv(master_path)
+    missing = [column for column in ('SYMBOL', 'LOT_SIZE') if column not in df.columns]
+    if missing:
+        raise ValueError(f"Instrument master {master_path} has no {', '.join(missing)} column")
+
+    df['SYMBOL'] = df['SYMBOL'].astype(str).str.strip().str.upper()
+    if 'EXPIRY' in df.columns:
+        df['EXPIRY'] = pd.to_datetime(df['EXPIRY'], errors='coerce')
+    df = df.sort_values(['SYMBOL', 'EXPIRY'] if 'EXPIRY' in df.columns else ['SYMBOL'], kind='stable')
+
+    arrays = {}
+    for column in df.columns:
+        values = df[column]
+        if column == 'EXPIRY':
+            arrays[column] = values.to_numpy(dtype='datetime64[D]')
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            arrays[column] = values.to_numpy()
+        else:
+            # Fixed-width unicode instead of object arrays, so the cache loads without pickle
+            arrays[column] = values.fillna('').astype(str).to_numpy(dtype=str)
+    stat = os.stat(master_path)
+    arrays['__source__'] = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    path = cache_path(master_path)
+    partial_path = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+    try:
+        with open(partial_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    print(f"Compiled instrument master {master_path} ({len(df)} instruments) to {path}")
+    return path
+
+
+class InstrumentMaster:
+    """Instrument columns as NumPy arrays, sorted by SYMBOL and EXPIRY, with hash indexes on both"""
+
+    def __init__(self, columns):
+        import numpy as np
+
+        self.columns = columns
+        self.symbols = columns['SYMBOL']
+        self.expiry = columns.get('EXPIRY')
+        self.lot_sizes = columns['LOT_SIZE']
+        # SYMBOL -> (first row, end row) of its contracts, which are adjacent since the rows are sorted
+        if len(self.symbols):
+            starts = np.concatenate([[0], np.flatnonzero(self.symbols[1:] != self.symbols[:-1]) + 1])
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+        ends = np.append(starts[1:], len(self.symbols))
+        self._by_symbol = dict(zip(self.symbols[starts].tolist(), zip(starts.tolist(), ends.tolist())))
+        # (SYMBOL, expiry date) -> row, built on the first lookup by expiry
+        self._by_key = None
+        self._current = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @classmethod
+    def load(cls, master_path=None):
+        """The master from its cache (compiled first if missing or stale), or None if there is no master"""
+        import numpy as np
+
+        master_path = master_path or find_master()
+        if not master_path:
+            return None
+        stat = os.stat(master_path)
+        with _lock:
+            loaded = _loaded.get(master_path)
+            if loaded and loaded[0] == (stat.st_size, stat.st_mtime_ns):
+                return loaded[1]
+            path = cache_path(master_path)
+            columns = None
+            if os.path.exists(path):
+                with np.load(path) as cache:
+                    if cache['__source__'].tolist() == [stat.st_size, stat.st_mtime_ns]:
+                        columns = {name: cache[name] for name in cache.files if name != '__source__'}
+            if columns is None:
+                with np.load(compile_master(master_path)) as cache:
+                    columns = {name: cache[name] for name in cache.files if name != '__source__'}
+            master = cls(columns)
+            _loaded[master_path] = ((stat.st_size, stat.st_mtime_ns), master)
+            return master
+
+    def lookup(self, symbol, expiry=None):
+        """
+        Row of a symbol's contract, or -1 if it is not listed. symbol is as in the master (upper case); expiry
+        is a date, datetime, numpy.datetime64 or ISO string, or None for the current contract.
+        """
+        if expiry is None or self.expiry is None:
+            row = self._current.get(symbol)
+            if row is None:
+                row = self._current[symbol] = self._current_row(symbol)
+            return row
+        expiry = expiry_key(expiry)
+        if expiry is None:
+            return self.lookup(symbol)
+        if self._by_key is None:
+            self._by_key = dict(zip(zip(self.symbols.tolist(), self.expiry.tolist()), range(len(self))))
+        return self._by_key.get((symbol, expiry), -1)
+
+    def _current_row(self, symbol):
+        import numpy as np
+
+        start, end = self._by_symbol.get(symbol, (-1, -1))
+        if start < 0 or self.expiry is None:
+            return start
+        # Contracts of a symbol are sorted by expiry, with undated ones last
+        position = start + int(np.searchsorted(self.expiry[start:end], np.datetime64(date.today(), 'D')))
+        if position < end and not np.isnat(self.expiry[position]):
+            return position
+        return end - 1
+
+    def lot_size(self, symbol, expiry=None):
+        row = self.lookup(str(symbol).strip().upper(), expiry)
+        return None if row < 0 else self.lot_sizes[row].item()
+
+    def row(self, symbol, expiry=None):
+        """All master columns of a contract as a dict, or None"""
+        row = self.lookup(str(symbol).strip().upper(), expiry)
+        return None if row < 0 else {name: values[row].item() for name, values in self.columns.items()}
+
+    def positions(self, symbols, expiries=None):
+        """
+        Master rows for arrays of symbols (and expiries as datetime64[D], NaT for none); -1 where not listed.
+        Only the distinct keys are looked up, then spread back to the rows.
+        """
+        import numpy as np
+        import pandas as pd
+
+        symbols = pd.Series(symbols).astype(str).str.strip().str.upper()
+        if expiries is None or self.expiry is None:
+            codes, uniques = pd.factorize(symbols)
+            rows = np.array([self.lookup(symbol) for symbol in uniques], dtype=np.int64)
+        else:
+            keys = pd.MultiIndex.from_arrays([symbols, pd.to_datetime(pd.Series(expiries), errors='coerce')])
+            codes, uniques = pd.factorize(keys)
+            rows = np.array([self.lookup(symbol, None if pd.isna(expiry) else expiry)
+                             for symbol, expiry in uniques], dtype=np.int64)
+        return rows[codes] if len(rows) else np.full(len(codes), -1, dtype=np.int64)
+
+
+def expiry_key(expiry):
+    """An expiry as a datetime.date, the type of the expiry index keys; None for NaT"""
+    import numpy as np
+
+    if expiry != expiry:
+        return None  # NaT
+    if isinstance(expiry, datetime):
+        return expiry.date()
+    if isinstance(expiry, date):
+        return expiry
+    return np.datetime64(expiry, 'D').item()
+
+
+def needs_lot_sizes(df):
+    """Whether an input DataFrame has LOT_SIZE or TOTAL_LOT_SIZE values missing"""
+    return any(column not in df.columns or df[column].isna().any() for column in ('LOT_SIZE', 'TOTAL_LOT_SIZE'))
+
+
+def _fill_from_master(df, master):
+    import numpy as np
+
+    missing = df['LOT_SIZE'].isna().to_numpy() if 'LOT_SIZE' in df.columns else np.ones(len(df), dtype=bool)
+    expiries = df['EXPIRY'][missing] if 'EXPIRY' in df.columns else None
+    rows = master.positions(df['SYMBOL'][missing], expiries)
+    found = rows >= 0
+    # A writable copy: to_numpy may return a read-only view of the column
+    lot_sizes = np.array(df['LOT_SIZE'].to_numpy(dtype=float, na_value=np.nan), copy=True) \
+        if 'LOT_SIZE' in df.columns else np.full(len(df), np.nan)
+    lot_sizes[np.flatnonzero(missing)[found]] = master.lot_sizes[rows[found]]
+    df['LOT_SIZE'] = lot_sizes
+    if not found.all():
+        unknown = sorted(set(df['SYMBOL'][missing][~found].astype(str)))
+        print(f"No lot size in the instrument master for {len(unknown)} symbols: {', '.join(unknown[:10])}")
+    print(f"Filled {int(found.sum())} lot sizes from the instrument master")
+    if not np.isnan(lot_sizes).any():
+        df['LOT_SIZE'] = lot_sizes.astype(np.int64)
+    return df
+
+
+def fill_lot_sizes(df, master=None):
+    """
+    Fill missing LOT_SIZE values from the instrument master and missing TOTAL_LOT_SIZE values as
+    LOT_SIZE * NO_OF_LOTS. Returns df unchanged if nothing is missing; without a master only TOTAL_LOT_SIZE is
+    filled. A value whose source columns are absent is left missing, for input validation to report the columns.
+    """
+    if not needs_lot_sizes(df):
+        return df
+    df = df.copy()
+    if ('LOT_SIZE' not in df.columns or df['LOT_SIZE'].isna().any()) and 'SYMBOL' in df.columns:
+        master = master or InstrumentMaster.load()
+        if master is None:
+            print("LOT_SIZE is missing and there is no instrument master in INSTRUMENTS/")
+        else:
+            df = _fill_from_master(df, master)
+    # TOTAL_LOT_SIZE is filled wherever LOT_SIZE and NO_OF_LOTS are known, with or without a master
+    if 'LOT_SIZE' not in df.columns or 'NO_OF_LOTS' not in df.columns:
+        return df
+    total_lot_size = df['LOT_SIZE'] * df['NO_OF_LOTS']
+    df['TOTAL_LOT_SIZE'] = df['TOTAL_LOT_SIZE'].fillna(total_lot_size) if 'TOTAL_LOT_SIZE' in df.columns \
+        else total_lot_size
+    return df
+
+
+if __name__ == "__main__":
+    import time
+
+    master_path = sys.argv[1] if len(sys.argv) > 1 else find_master()
+    if not master_path:
+        sys.exit(f"No instrument master found in {default_master_dir()}")
+    compile_master(master_path)
+    _loaded.clear()
+    started = time.perf_counter()
+    master = InstrumentMaster.load(master_path)
+    print(f"Loaded {len(master)} instruments from the cache in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    symbols = list(master._by_symbol)
+    keys = (symbols * (1_000_000 // len(symbols) + 1))[:1_000_000]
+    lookup = master.lookup
+    started = time.perf_counter()
+    for symbol in keys:
+        lookup(symbol)
+    print(f"Lookup: {(time.perf_counter() - started) / len(keys) * 1e9:.0f}ns per symbol")
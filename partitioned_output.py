@@ -0,0 +1,101 @@
+"""
+Per-symbol partitioned reports, for inputs that span several symbols.
+
+partition="symbol" writes one report and one parameter file per SYMBOL, named after that symbol, plus an
+index workbook listing them. partition="parquet" writes the whole report as one Hive-partitioned Parquet
+dataset (a SYMBOLS=<symbol>/ directory per symbol), so readers can load only their symbols, and a parameter
+file per symbol; it needs pyarrow.
+
+The per-symbol workbooks are written on a thread pool once the input is large enough to be worth it; openpyxl
+mostly holds the GIL, but the zip compression and file writes of one workbook overlap with the others.
+"""
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from brokerage_calculator import (PARAMETER_COLUMNS, base_dir, unique_path, write_batch_index, write_parameter_file,
+                                  write_report)
+
+# Below this many rows the workbooks are written one after another
+PARALLEL_MIN_ROWS = 20000
+
+
+def _run(func, jobs, rows, workers=None):
+    """func(*job) for every job, on a thread pool for inputs of PARALLEL_MIN_ROWS rows or more"""
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1 or rows < PARALLEL_MIN_ROWS:
+        return [func(*job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="partition-writer") as pool:
+        return list(pool.map(func, *zip(*jobs)))
+
+
+def _parameter_parts(df):
+    """(symbol, parameter rows) per SYMBOL of the input rows df"""
+    return [(str(symbol), parameter_df)
+            for symbol, parameter_df in df[PARAMETER_COLUMNS].groupby('SYMBOL', sort=True)]
+
+
+def _write_symbol(symbol, results_df, parameter_df, suffix, output_dir):
+    # Returns the index row of the symbol
+    output_file = write_report(results_df, symbol, suffix, output_dir)
+    parameter_output = write_parameter_file(parameter_df, symbol)
+    return {
+        'SYMBOL': symbol,
+        'ROWS': len(parameter_df),
+        'COMPUTED': len(results_df),
+        'FAILED': len(parameter_df) - len(results_df),
+        'TOTAL_PREMIUM_VALUE': float(results_df['TOTAL_PREMIUM_VALUE'].sum()) if len(results_df) else 0.0,
+        'TOTAL TAX AND CHARGES': float(results_df['TOTAL TAX AND CHARGES'].sum()) if len(results_df) else 0.0,
+        'REPORT': output_file,
+        'PARAMETER_FILE': parameter_output,
+    }
+
+
+def write_symbol_reports(df, results_df, suffix="", input_file="input", output_dir=None, workers=None):
+    """
+    Write a report and parameter file per SYMBOL of the input rows df and their results, and an index
+    OUTPUT/{input name}_PARTITIONS{timestamp}.xlsx. Returns (index path, parameter file paths).
+    """
+    results_by_symbol = {str(symbol): part for symbol, part in results_df.groupby('SYMBOLS', sort=False)}
+    # A symbol whose rows all failed still gets its (empty) report
+    jobs = [(symbol, results_by_symbol.get(symbol, results_df.iloc[:0]), parameter_df, suffix, output_dir)
+            for symbol, parameter_df in _parameter_parts(df)]
+    print(f"Writing reports for {len(jobs)} symbols")
+    index_rows = _run(_write_symbol, jobs, len(df), workers)
+
+    stem = f"{os.path.splitext(os.path.basename(input_file))[0]}_PARTITIONS"
+    return write_batch_index(index_rows, output_dir, stem), [row['PARAMETER_FILE'] for row in index_rows]
+
+
+def write_parquet_dataset(results_df, input_file="input", output_dir=None):
+    """
+    Write the results as a Hive-partitioned Parquet dataset OUTPUT/{input name}_REPORT{timestamp}/SYMBOLS=.../
+    and return its directory
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_dir = output_dir or os.path.join(base_dir(), "OUTPUT")
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    dataset_dir = unique_path(output_dir, f"{stem}_REPORT{timestamp}", "", make_dir=True)
+
+    results_df = results_df.copy()
+    for column in results_df.columns[results_df.dtypes == object]:
+        # Parquet columns have one type; a scraped column mixing numbers and text (e.g. "1,234.00") becomes text
+        if column != 'SYMBOLS' and results_df[column].map(type).nunique() > 1:
+            results_df[column] = results_df[column].astype(str)
+    results_df.to_parquet(dataset_dir, partition_cols=['SYMBOLS'], index=False)
+    print(f"\nResults saved to {dataset_dir} ({results_df['SYMBOLS'].nunique()} symbol partitions)")
+    return dataset_dir
+
+
+def write_partitions(df, results_df, suffix, partition, input_file, output_dir=None):
+    """
+    The partitioned outputs of one input, as process_input_file returns them: (partition index, parameter
+    files) for "symbol", (dataset directory, parameter files) for "parquet", with a parameter file per symbol
+    """
+    if partition == 'symbol':
+        return write_symbol_reports(df, results_df, suffix, input_file, output_dir)
+    dataset_dir = write_parquet_dataset(results_df, input_file, output_dir)
+    parts = _parameter_parts(df)
+    return dataset_dir, _run(lambda symbol, parameter_df: write_parameter_file(parameter_df, symbol), parts, len(df))
@@ -0,0 +1,300 @@
+"""
+Optional Polars backend for local and calibrated runs.
+
+Computing the charges, the per-file totals and (for CSV) writing the report are one lazy Polars query over the
+input, which Polars runs in parallel across cores; CSV and Parquet inputs are scanned rather than read through
+pandas, and validated by Polars expressions in the same scan. The report has the same columns and values as
+BrokerageCalculator.compute: the charge expressions below repeat the floating-point operations of
+charge_engine.compute_charges_arrays in the same order. Scrape and verify mode scrape row by row and stay on the
+pandas path.
+
+Select it with backend="polars" in process_input_file / process_input_files, BROKERAGE_BACKEND=polars for the
+segment scripts, or --backend polars for batch_run.py.
+"""
+import os
+
+from ingest_cache import cache_enabled
+from input_validation import INTEGER_COLUMNS, PRICE_COLUMNS, check_columns
+from brokerage_calculator import (PARAMETER_COLUMNS, REPORT_SUFFIXES, BrokerageCalculator, archive_input, read_input,
+                                  record_report, report_path, report_rejected_rows, report_symbol, write_batch_index,
+                                  write_parameter_file, write_report)
+
+
+def divide_expr(expr, divisor):
+    """expr / divisor, bit for bit as NumPy computes it"""
+    import numpy as np
+
+    # Polars divides by a constant through its reciprocal, which can differ from NumPy in the last bit
+    # (5.350000000000001 instead of 5.35); the ufunc runs NumPy's division on each batch instead
+    return np.divide(expr, float(divisor))
+
+
+def round_half_up_expr(expr, decimals=2):
+    """charge_engine.round_half_up_array as a Polars expression"""
+    multiplier = 10 ** decimals
+    return divide_expr((expr * multiplier + 0.5 + 1e-9).floor(), multiplier)
+
+
+def round_half_even_expr(expr, decimals):
+    """np.round(values, decimals): scale, round half to even, unscale"""
+    import polars as pl
+
+    scaled = expr * (10 ** decimals)
+    rounded = (scaled + 0.5).floor()
+    # floor(x + 0.5) rounds halves up; an odd result from an exact half goes back down to the even neighbour
+    rounded = pl.when((rounded - scaled == 0.5) & (rounded % 2 != 0)).then(rounded - 1).otherwise(rounded)
+    return divide_expr(rounded, 10 ** decimals)
+
+
+def order_brokerage_expr(schedule, leg_turnover):
+    """charge_engine.order_brokerage_array as a Polars expression"""
+    import polars as pl
+
+    rate = schedule['brokerage_rate']
+    cap = schedule['brokerage_cap']
+    if rate is None:
+        brokerage = pl.lit(float(cap))
+    elif cap is None:
+        brokerage = rate * leg_turnover
+    else:
+        brokerage = pl.min_horizontal(rate * leg_turnover, pl.lit(float(cap)))
+    return pl.when(leg_turnover > 0).then(brokerage).otherwise(0.0)
+
+
+def report_query(lazy, schedule):
+    """The report rows of a LazyFrame of input rows, as a LazyFrame sorted by SL_N0"""
+    import polars as pl
+
+    col = pl.col
+    lazy = lazy.with_columns(
+        col('LOT_SIZE').cast(pl.Int64).alias('_lot_size'),
+        col('BUY_VALUE').cast(pl.Float64).alias('_buy_value'),
+        col('SELL_VALUE').cast(pl.Float64).alias('_sell_value'),
+        (col('LOT_SIZE').cast(pl.Int64) * col('NO_OF_LOTS').cast(pl.Int64)).cast(pl.Float64).alias('_quantity'),
+    ).with_columns(
+        (col('_buy_value') * col('_quantity')).alias('_buy_turnover'),
+        (col('_sell_value') * col('_quantity')).alias('_sell_turnover'),
+    ).with_columns(
+        (col('_buy_turnover') + col('_sell_turnover')).alias('_turnover'),
+    )
+
+    # Each stage only uses columns of earlier stages, like the statements of compute_charges_arrays
+    lazy = lazy.with_columns(
+        round_half_up_expr(order_brokerage_expr(schedule, col('_buy_turnover'))
+                           + order_brokerage_expr(schedule, col('_sell_turnover'))).alias('BROKERAGE'),
+        round_half_up_expr(schedule['stt_buy_rate'] * col('_buy_turnover')
+                           + schedule['stt_sell_rate'] * col('_sell_turnover'),
+                           schedule['stt_decimals']).alias('STT_TOTAL'),
+        round_half_up_expr(round_half_up_expr(schedule['exchange_rate'] * col('_turnover'))
+                           + round_half_up_expr(schedule['ipft_rate'] * col('_turnover')))
+        .alias('EXCHANGE_TXN_Charge'),
+        round_half_up_expr(schedule['sebi_rate'] * col('_turnover')).alias('SEBI_CHARGES'),
+        round_half_up_expr(schedule['stamp_rate'] * col('_buy_turnover'), schedule['stamp_decimals'])
+        .alias('STAMP DUTY'),
+    ).with_columns(
+        round_half_up_expr(schedule['gst_rate'] * (col('BROKERAGE') + col('EXCHANGE_TXN_Charge')
+                                                   + col('SEBI_CHARGES'))).alias('GST'),
+    ).with_columns(
+        round_half_up_expr(col('BROKERAGE') + col('STT_TOTAL') + col('EXCHANGE_TXN_Charge') + col('GST')
+                           + col('SEBI_CHARGES') + col('STAMP DUTY')).alias('TOTAL TAX AND CHARGES'),
+    )
+
+    total = col('TOTAL TAX AND CHARGES')
+    premium = col('_buy_value') + col('_sell_value')
+    percentage = pl.when(col('_turnover') != 0).then(round_half_even_expr(total / col('_turnover') * 100, 3))
+    return lazy.sort('SL_N0', maintain_order=True).select(
+        col('SL_N0'),
+        col('SYMBOL').alias('SYMBOLS'),
+        col('_lot_size').alias('LOT_SIZE'),
+        premium.alias('PREMUIM_VALUE'),
+        col('NO_OF_LOTS'),
+        col('TOTAL_LOT_SIZE'),
+        (premium * col('_quantity')).alias('TOTAL_PREMIUM_VALUE'),
+        col('BROKERAGE'), col('STT_TOTAL'), col('EXCHANGE_TXN_Charge'), col('GST'), col('SEBI_CHARGES'),
+        col('STAMP DUTY'), total,
+        pl.when(col('_quantity') != 0).then(round_half_up_expr(total / col('_quantity')))
+        .otherwise(0.0).alias('POINTS TO BREAKEVEN'),
+        total.alias('TOTAL BROKERAGE'),
+        # Same text as the pandas report: Polars prints floats like Python's repr
+        pl.format("{}%", percentage.otherwise(0.0)).alias('BROKERAGE %'),
+    )
+
+
+def totals_query(report):
+    """One-row LazyFrame with the row count and the sums listed in the batch index"""
+    import polars as pl
+
+    return report.select(
+        pl.len().alias('COMPUTED'),
+        pl.col('TOTAL_PREMIUM_VALUE').sum(),
+        pl.col('TOTAL TAX AND CHARGES').sum(),
+    )
+
+
+def scan_input(input_file):
+    """
+    A LazyFrame over an input file: CSV and Parquet are scanned by Polars, workbooks go through read_input.
+    Inputs without LOT_SIZE / TOTAL_LOT_SIZE columns also go through read_input, to be filled from the
+    instrument master.
+    """
+    import polars as pl
+
+    lower = input_file.lower()
+    lazy = None
+    if lower.endswith('.csv'):
+        lazy = pl.scan_csv(input_file)
+    elif lower.endswith('.parquet'):
+        lazy = pl.scan_parquet(input_file)
+    if lazy is not None and {'LOT_SIZE', 'TOTAL_LOT_SIZE'} <= set(lazy.collect_schema().names()):
+        return lazy
+    return pl.from_pandas(read_input(input_file, cache=cache_enabled())).lazy()
+
+
+def reject_reason_expr():
+    """
+    The REJECT_REASON of input_validation.validate_input as one expression: the checks a row fails, joined by
+    "; ", or "" for a valid row
+    """
+    import polars as pl
+
+    col = pl.col
+    checks = []
+
+    def reject(mask, reason):
+        checks.append(pl.when(mask.fill_null(False)).then(pl.lit(reason)))
+
+    symbols = col('SYMBOL').cast(pl.String)
+    reject(symbols.is_null() | (symbols.str.strip_chars() == ""), "missing SYMBOL")
+
+    numbers = {}
+    for column in INTEGER_COLUMNS + PRICE_COLUMNS:
+        # Text that is not a number becomes null; NaN counts as missing, as it does for pandas
+        values = col(column).cast(pl.Float64, strict=False)
+        missing = col(column).is_null() | values.is_nan().fill_null(False)
+        reject(missing, f"missing {column}")
+        reject(~missing & ~values.is_finite().fill_null(False), f"{column} is not a number")
+        numbers[column] = values
+
+    # The remaining checks only look at numbers, so a missing or non-numeric value is reported once
+    finite = {column: values.is_finite().fill_null(False) for column, values in numbers.items()}
+    for column in INTEGER_COLUMNS:
+        reject(finite[column] & (numbers[column] != numbers[column].floor()), f"{column} is not a whole number")
+    reject(numbers['LOT_SIZE'] <= 0, "LOT_SIZE is not positive")
+    reject(numbers['NO_OF_LOTS'] <= 0, "NO_OF_LOTS is not positive")
+    for column in PRICE_COLUMNS:
+        reject(numbers[column] < 0, f"{column} is negative")
+    reject(finite['TOTAL_LOT_SIZE'] & finite['LOT_SIZE'] & finite['NO_OF_LOTS']
+           & (numbers['TOTAL_LOT_SIZE'] != numbers['LOT_SIZE'] * numbers['NO_OF_LOTS']),
+           "TOTAL_LOT_SIZE is not LOT_SIZE * NO_OF_LOTS")
+    return pl.concat_str(checks, separator="; ", ignore_nulls=True)
+
+
+def validated_input(input_file):
+    """
+    (LazyFrame of the valid rows, valid rows as pandas, number of rejected rows) of an input file. Validation
+    runs in the scan: the valid rows' parameter columns (which the parameter file needs anyway) and the
+    rejected rows are collected together, and the report query runs on the collected valid rows.
+    """
+    import polars as pl
+
+    lazy = scan_input(input_file)
+    schema = lazy.collect_schema()
+    check_columns(schema.names(), input_file)
+
+    flagged = lazy.with_row_index('INPUT_ROW', offset=2).with_columns(reject_reason_expr().alias('REJECT_REASON'))
+    columns = []
+    for column in PARAMETER_COLUMNS:
+        expr = pl.col(column)
+        if column != 'SYMBOL' and schema[column] == pl.String:
+            # A column with a non-numeric value in a rejected row is read as text
+            expr = expr.cast(pl.Float64)
+            if column in INTEGER_COLUMNS:
+                expr = expr.cast(pl.Int64)
+        columns.append(expr)
+    valid, rejected = pl.collect_all([flagged.filter(pl.col('REJECT_REASON') == "").select(columns),
+                                      flagged.filter(pl.col('REJECT_REASON') != "")])
+
+    report_rejected_rows(rejected.to_pandas(), len(valid) + len(rejected), len(valid), input_file)
+    return valid.lazy(), valid.to_pandas(), len(rejected)
+
+
+def collect_reports(lazies, schedule):
+    """Run the report and totals queries of several inputs as one Polars job; one (report, totals) per input"""
+    import polars as pl
+
+    queries = []
+    for lazy in lazies:
+        report = report_query(lazy, schedule)
+        queries += [report, totals_query(report)]
+    frames = pl.collect_all(queries)
+    return [(frames[index], frames[index + 1].row(0, named=True)) for index in range(0, len(frames), 2)]
+
+
+def process_input_file_polars(input_file, segment="options", mode="local", stream_output=None, partition=None,
+                              parameter_output=None):
+    """process_input_file on the Polars backend; returns (report path, parameter file path)"""
+    calculator = BrokerageCalculator(segment, mode)
+    archive_input(input_file)
+    lazy, df, _ = validated_input(input_file)
+    symbol = report_symbol(df)
+    parameter_output = write_parameter_file(df, symbol, parameter_output) if not partition else None
+
+    if stream_output == 'csv':
+        # The report streams to the CSV file without being collected
+        output_file = report_path(symbol, REPORT_SUFFIXES[segment], 'csv')
+        report_query(lazy, calculator.schedule).sink_csv(output_file)
+        print(f"\nResults saved to {output_file}")
+        return output_file, parameter_output
+
+    [(report_rows, totals)] = collect_reports([lazy], calculator.schedule)
+    print(f"Processed {len(df)} rows from {input_file} with Polars")
+    results_df = report_rows.to_pandas()
+    calculator.stats = {'rows': len(df), 'computed': totals['COMPUTED'], 'failed': len(df) - totals['COMPUTED']}
+    if partition:
+        from partitioned_output import write_partitions
+        return write_partitions(df, results_df, REPORT_SUFFIXES[segment], partition, input_file)
+    output_file = write_report(results_df, symbol, REPORT_SUFFIXES[segment])
+    record_report(input_file, output_file, results_df, calculator)
+    return output_file, parameter_output
+
+
+def process_input_files_polars(input_files, segment="options", mode="local"):
+    """process_input_files on the Polars backend: all files are computed in one Polars job"""
+    calculator = BrokerageCalculator(segment, mode)
+    index_rows = []
+    inputs = []
+    symbols = {}
+    for input_file in input_files:
+        try:
+            archive_input(input_file)
+            lazy, df, rejected_rows = validated_input(input_file)
+            symbol = report_symbol(df)
+            # Several files for one symbol would overwrite each other's parameter file
+            parameter_output = (f"{symbol}_parameter.xlsx" if symbol not in symbols else
+                                f"{os.path.splitext(os.path.basename(input_file))[0]}_parameter.xlsx")
+            symbols[symbol] = input_file
+            write_parameter_file(df, symbol, parameter_output)
+            inputs.append((input_file, lazy, len(df), rejected_rows, symbol, parameter_output))
+        except Exception as exc:
+            print(f"Error reading {input_file}: {exc}")
+            index_rows.append({'INPUT_FILE': input_file, 'ERROR': str(exc)})
+
+    reports = collect_reports([lazy for _, lazy, _, _, _, _ in inputs], calculator.schedule)
+    for (input_file, _, rows, rejected_rows, symbol, parameter_output), (report_rows, totals) in zip(inputs, reports):
+        results_df = report_rows.to_pandas()
+        output_file = write_report(results_df, symbol, REPORT_SUFFIXES[segment])
+        record_report(input_file, output_file, results_df, calculator)
+        index_rows.append({
+            'INPUT_FILE': input_file,
+            'SYMBOL': symbol,
+            'ROWS': rows + rejected_rows,
+            'REJECTED': rejected_rows,
+            'COMPUTED': totals['COMPUTED'],
+            'FAILED': rows - totals['COMPUTED'],
+            'TOTAL_PREMIUM_VALUE': float(totals['TOTAL_PREMIUM_VALUE'] or 0.0),
+            'TOTAL TAX AND CHARGES': float(totals['TOTAL TAX AND CHARGES'] or 0.0),
+            'REPORT': output_file,
+            'PARAMETER_FILE': parameter_output,
+        })
+    index_rows.sort(key=lambda row: input_files.index(row['INPUT_FILE']))
+    return write_batch_index(index_rows)
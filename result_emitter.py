@@ -0,0 +1,78 @@
+import csv
+
+# Marks a row that failed, so the rows after it are not held back waiting for it
+_SKIPPED = object()
+
+
+class ReorderBuffer:
+    """
+    Emits results in position order while they complete in any order: a result is passed to emit as soon as
+    every lower position has been emitted or skipped. Only the out-of-order window is held in memory.
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.next_position = 0
+        self.max_window = 0
+        self._pending = {}
+
+    def add(self, position, row):
+        self._pending[position] = row
+        self.max_window = max(self.max_window, len(self._pending))
+        while self.next_position in self._pending:
+            row = self._pending.pop(self.next_position)
+            if row is not _SKIPPED:
+                self.emit(row)
+            self.next_position += 1
+
+    def skip(self, position):
+        self.add(position, _SKIPPED)
+
+
+class CsvSink:
+    """Writes result rows to a CSV file as they arrive; the header comes from the first row"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._columns = None
+
+    def write(self, row):
+        if self._columns is None:
+            self._columns = list(row)
+            self._writer.writerow(self._columns)
+        self._writer.writerow([row.get(column) for column in self._columns])
+        self.rows += 1
+        # Flush so the partial report can be followed while the run is in progress
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxSink:
+    """Writes result rows to an .xlsx file with openpyxl's write-only mode (rows are not kept in memory)"""
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.rows = 0
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+        self._columns = None
+
+    def write(self, row):
+        if self._columns is None:
+            self._columns = list(row)
+            self._sheet.append(self._columns)
+        self._sheet.append([row.get(column) for column in self._columns])
+        self.rows += 1
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+SINKS = {'csv': CsvSink, 'xlsx': XlsxSink}
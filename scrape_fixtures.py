@@ -0,0 +1,97 @@
+import os
+import json
+import threading
+
+# BROKERAGE_SCRAPE_MODE selects how calculate_brokerage gets its values:
+#   live   - drive the calculator page (default)
+#   record - drive the calculator page and save every response to the fixture store
+#   replay - serve responses from the fixture store only; a missing response raises FixtureMiss
+SCRAPE_MODES = ('live', 'record', 'replay')
+
+
+class FixtureMiss(Exception):
+    """Raised in replay mode when no response was recorded for the requested inputs"""
+
+
+def default_fixture_path():
+    return os.environ.get("BROKERAGE_FIXTURES") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "FIXTURES", "scrape_fixtures.jsonl")
+
+
+class FixtureStore:
+    """
+    Recorded calculator responses, one JSON line per (segment, quantity, buy value, sell value):
+        {"k": ["options", 20, 348, 348], "v": ["40", "7", "4.95", "8.09", "0.01", "0", "60.05", "3.00"]}
+    The file is append-only so an interrupted recording keeps everything scraped so far.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._responses = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as fixture_file:
+                for line in fixture_file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._responses[self.key(*entry['k'])] = entry['v']
+
+    @staticmethod
+    def key(segment, total_lot_size, buy_value, sell_value):
+        return segment, float(total_lot_size), float(buy_value), float(sell_value)
+
+    def __len__(self):
+        return len(self._responses)
+
+    def get(self, segment, total_lot_size, buy_value, sell_value):
+        return self._responses.get(self.key(segment, total_lot_size, buy_value, sell_value))
+
+    def put(self, segment, total_lot_size, buy_value, sell_value, values):
+        key = self.key(segment, total_lot_size, buy_value, sell_value)
+        values = [str(value) for value in values]
+        with self._lock:
+            if self._responses.get(key) == values:
+                return
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(self.path, 'a', encoding='utf-8') as fixture_file:
+                fixture_file.write(json.dumps({'k': list(key), 'v': values}, ensure_ascii=False,
+                                              separators=(',', ':')) + "\n")
+            self._responses[key] = values
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_fixture_store(path=None):
+    """Return the shared store for a path, loading it on first use"""
+    path = path or default_fixture_path()
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = FixtureStore(path)
+        return _stores[path]
+
+
+def scrape_with_fixtures(segment, scrape, total_lot_size, buy_value, sell_value):
+    """
+    Return the eight calculator values for one trade according to BROKERAGE_SCRAPE_MODE.
+    scrape(total_lot_size, buy_value, sell_value) is the script's live scraper.
+    """
+    mode = os.environ.get("BROKERAGE_SCRAPE_MODE", "live")
+    if mode == 'live':
+        return scrape(total_lot_size, buy_value, sell_value)
+
+    store = get_fixture_store()
+    if mode == 'replay':
+        values = store.get(segment, total_lot_size, buy_value, sell_value)
+        if values is None:
+            raise FixtureMiss(f"No recorded {segment} response for quantity={total_lot_size} "
+                              f"buy={buy_value} sell={sell_value} in {store.path}")
+        return values
+    if mode == 'record':
+        values = scrape(total_lot_size, buy_value, sell_value)
+        store.put(segment, total_lot_size, buy_value, sell_value, values)
+        return values
+    raise ValueError(f"Unknown BROKERAGE_SCRAPE_MODE {mode!r}, expected one of {', '.join(SCRAPE_MODES)}")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Streaming counterpart of process_excel_file for fills arriving during the trading day.
+
+Reads newline-delimited JSON trades from stdin (results to stdout) or from a local socket (results back on the
+same connection), computes the charges of every trade as it arrives and keeps running totals per symbol and per
+segment. Nothing but the totals is retained, so memory is bounded by the number of symbols, not fills.
+
+    tail -f fills.jsonl | python stream_fills.py
+    python stream_fills.py --unix /tmp/fills.sock      # or --port 8767
+
+Input line:  {"symbol": "NIFTY", "segment": "options", "lot_size": 20, "no_of_lots": 1,
+              "buy_value": 348, "sell_value": 348}
+Output line: the trade's charges plus SYMBOL_TOTAL_CHARGES / SEGMENT_TOTAL_CHARGES running totals. Every
+--totals-every trades, and at end of input unless no fill came in since the last one, a {"type": "totals", ...}
+line with the full per-symbol and per-segment totals is emitted. Fills that are not valid (e.g. a negative
+quantity or value) get a {"type": "error", ...} line.
+"""
+import os
+import sys
+import json
+import argparse
+import contextlib
+import threading
+import socketserver
+
+from charge_engine import compute_charges
+from calc_service import load_service_schedules, parse_trade
+
+TOTAL_COLUMNS = ['BROKERAGE', 'STT_TOTAL', 'EXCHANGE_TXN_Charge', 'GST', 'SEBI_CHARGES', 'STAMP DUTY',
+                 'TOTAL TAX AND CHARGES']
+
+
+class RunningTotals:
+    """Per-key running sums of trades, turnover and charge components"""
+
+    def __init__(self):
+        self._totals = {}
+
+    def add(self, key, turnover, charges):
+        totals = self._totals.get(key)
+        if totals is None:
+            totals = self._totals[key] = [0, 0.0] + [0.0] * len(TOTAL_COLUMNS)
+        totals[0] += 1
+        totals[1] += turnover
+        for index, column in enumerate(TOTAL_COLUMNS, start=2):
+            totals[index] += charges[column]
+        return totals
+
+    def snapshot(self):
+        return {str(key): dict(zip(['TRADES', 'TURNOVER'] + TOTAL_COLUMNS,
+                                   [totals[0]] + [round(value, 2) for value in totals[1:]]))
+                for key, totals in self._totals.items()}
+
+
+class FillProcessor:
+    def __init__(self, schedules, totals_every=10000):
+        self.schedules = schedules
+        self.totals_every = totals_every
+        self.by_symbol = RunningTotals()
+        self.by_segment = RunningTotals()
+        self.count = 0
+        # Fill count of the last totals line emitted
+        self._totals_count = None
+        self._lock = threading.Lock()
+
+    def process_line(self, line):
+        """Return the output lines (without newline) for one input line"""
+        try:
+            fill = json.loads(line)
+            if not isinstance(fill, dict):
+                raise TypeError(f"A fill must be a JSON object, got {type(fill).__name__}")
+            segment, quantity, buy_value, sell_value = parse_trade(fill)
+            symbol = fill.get('symbol', 'UNKNOWN')
+            if not isinstance(symbol, str):
+                raise TypeError(f"symbol must be a string, got {type(symbol).__name__}")
+        except (ValueError, KeyError, TypeError) as exc:
+            # A bad fill gets an error line; the stream and its running totals carry on
+            return [json.dumps({'type': 'error', 'error': str(exc), 'line': line.strip()})]
+
+        charges = compute_charges(self.schedules[segment], quantity, quantity, buy_value, sell_value)
+        turnover = (buy_value + sell_value) * quantity
+
+        with self._lock:
+            self.count += 1
+            symbol_totals = self.by_symbol.add(symbol, turnover, charges)
+            segment_totals = self.by_segment.add(segment, turnover, charges)
+            seq = self.count
+            emit_totals = self.totals_every and seq % self.totals_every == 0
+
+        result = {'type': 'fill', 'seq': seq, 'symbol': symbol, 'segment': segment, 'quantity': quantity,
+                  'turnover': turnover}
+        if 'id' in fill:
+            result['id'] = fill['id']
+        result.update(charges)
+        result['SYMBOL_TOTAL_CHARGES'] = round(symbol_totals[-1], 2)
+        result['SEGMENT_TOTAL_CHARGES'] = round(segment_totals[-1], 2)
+
+        lines = [json.dumps(result)]
+        if emit_totals:
+            lines.append(self.totals_line())
+        return lines
+
+    def totals_line(self):
+        with self._lock:
+            self._totals_count = self.count
+            return json.dumps({'type': 'totals', 'trades': self.count, 'symbols': self.by_symbol.snapshot(),
+                               'segments': self.by_segment.snapshot()})
+
+    def final_totals_lines(self):
+        """The end of input totals line, or none if it would repeat the last totals line"""
+        with self._lock:
+            if self._totals_count == self.count:
+                return []
+        return [self.totals_line()]
+
+
+def process_stream(input_stream, output_stream, processor):
+    """Process every line of input_stream, writing result lines to output_stream as they are produced"""
+    write = output_stream.write
+    for line in input_stream:
+        if line.strip():
+            write("\n".join(processor.process_line(line)) + "\n")
+            output_stream.flush()
+    for out in processor.final_totals_lines():
+        write(out + "\n")
+    output_stream.flush()
+
+
+def make_socket_handler(processor):
+    class FillHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw_line in self.rfile:
+                line = raw_line.decode('utf-8')
+                if line.strip():
+                    for out in processor.process_line(line):
+                        self.wfile.write(out.encode('utf-8') + b"\n")
+            for out in processor.final_totals_lines():
+                self.wfile.write(out.encode('utf-8') + b"\n")
+
+    return FillHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute charges for a stream of fills (newline-delimited JSON)")
+    parser.add_argument("--unix", default=None, help="read fills from connections on this Unix socket")
+    parser.add_argument("--port", type=int, default=None, help="read fills from TCP connections on localhost")
+    parser.add_argument("--schedule-dir", default=None)
+    parser.add_argument("--totals-every", type=int, default=10000,
+                        help="emit a full totals line every N fills (0 disables)")
+    args = parser.parse_args()
+
+    # stdout carries the results, so schedule loading messages go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        schedules = load_service_schedules(args.schedule_dir)
+    processor = FillProcessor(schedules, args.totals_every)
+    if args.unix or args.port:
+        if args.unix:
+            if os.path.exists(args.unix):
+                os.remove(args.unix)
+            server = socketserver.ThreadingUnixStreamServer(args.unix, make_socket_handler(processor))
+        else:
+            server = socketserver.ThreadingTCPServer(("127.0.0.1", args.port), make_socket_handler(processor))
+        server.daemon_threads = True
+        print(f"Reading fills from {args.unix or f'127.0.0.1:{args.port}'}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        process_stream(sys.stdin, sys.stdout, processor)
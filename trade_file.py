@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Fixed-width binary trade files for back-tests with more trades than fit through pandas.
+
+The calculator maps a trade file with numpy.memmap and computes it in chunks into a result file of the same
+row count (row i of the results is row i of the trades), also memory-mapped. Memory use depends on the chunk
+size, not the file size, and both files are read and written sequentially, so the page cache does the I/O.
+
+Trade file (all little-endian):
+    header, 64 bytes:
+        0   8s   magic b"BRKTRD01"
+        8   u4   record size in bytes (40)
+        12  u4   reserved, 0
+        16  u8   number of trades
+        24  u8   byte offset of the symbol table
+        32  u8   byte length of the symbol table
+        40  24   reserved, 0
+    trades, 40 bytes each, from byte 64:
+        0   i8   SL_N0
+        8   u4   symbol id (index into the symbol table)
+        12  i4   LOT_SIZE
+        16  i4   NO_OF_LOTS
+        20  u4   reserved, 0
+        24  f8   BUY_VALUE
+        32  f8   SELL_VALUE
+    symbol table: the symbols as UTF-8, one per line ("\\n"); symbol id n is line n
+
+Result file: the same 64-byte header with magic b"BRKRES01", record size 80 and no symbol table, then per trade
+SL_N0 (i8) followed by the float64 charges in RESULT_FIELDS order. BROKERAGE % is the number without the % sign.
+
+    python trade_file.py generate 100000000 trades.brt      # synthetic back-test trades
+    python trade_file.py convert NIFTY_input.csv trades.brt
+    python trade_file.py compute trades.brt results.brr --segment options --mode local
+    python trade_file.py head results.brr
+"""
+import struct
+import argparse
+
+TRADE_MAGIC = b"BRKTRD01"
+RESULT_MAGIC = b"BRKRES01"
+HEADER = struct.Struct('<8sIIQQQ24x')  # magic, record size, reserved, rows, symbol table offset, length
+
+TRADE_RECORD = [('sl_no', '<i8'), ('symbol_id', '<u4'), ('lot_size', '<i4'), ('no_of_lots', '<i4'),
+                ('reserved', '<u4'), ('buy_value', '<f8'), ('sell_value', '<f8')]
+
+# Charges stored per trade in a result file, after SL_N0
+RESULT_FIELDS = ["BROKERAGE", "STT_TOTAL", "EXCHANGE_TXN_Charge", "GST", "SEBI_CHARGES", "STAMP DUTY",
+                 "TOTAL TAX AND CHARGES", "POINTS TO BREAKEVEN", "BROKERAGE %"]
+
+# Trades per chunk: 40 MB of trades and 80 MB of results, plus the engine's temporaries
+CHUNK_ROWS = 1 << 20
+
+
+def trade_dtype():
+    import numpy as np
+    return np.dtype(TRADE_RECORD)
+
+
+def result_dtype():
+    import numpy as np
+    return np.dtype([('sl_no', '<i8')] + [(field, '<f8') for field in RESULT_FIELDS])
+
+
+def read_header(path, magic):
+    """(record size, rows, symbol table offset, symbol table length) of a trade or result file"""
+    with open(path, 'rb') as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size or data[:8] != magic:
+        raise ValueError(f"{path} is not a {magic.decode()} file")
+    _, record_size, _, rows, symbols_offset, symbols_length = HEADER.unpack(data)
+    return record_size, rows, symbols_offset, symbols_length
+
+
+class TradeFileWriter:
+    """
+    Writes a trade file chunk by chunk, so files larger than memory can be generated. Symbols get ids in order of
+    first appearance; the header is completed on close.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.symbols = {}
+        self._file = open(path, 'wb')
+        self._file.write(bytes(HEADER.size))
+
+    def symbol_id(self, symbol):
+        return self.symbols.setdefault(str(symbol), len(self.symbols))
+
+    def write(self, sl_no, symbol_ids, lot_size, no_of_lots, buy_value, sell_value):
+        """
+        Append a chunk of trades given as equal-length arrays (symbol_ids from symbol_id). Raises ValueError if a
+        lot value is not a whole number that fits the i4 field, rather than storing it truncated or wrapped.
+        """
+        import numpy as np
+
+        largest = np.iinfo(np.int32).max
+        for name, values in (('LOT_SIZE', lot_size), ('NO_OF_LOTS', no_of_lots)):
+            values = np.asarray(values, dtype=float)
+            with np.errstate(invalid='ignore'):
+                bad = ~((values >= 1) & (values <= largest) & (values == np.floor(values)))
+            if bad.any():
+                raise ValueError(f"{int(bad.sum())} trades have a {name} that is not a whole number from 1 to "
+                                 f"{largest}")
+
+        records = np.zeros(len(sl_no), dtype=trade_dtype())
+        records['sl_no'] = sl_no
+        records['symbol_id'] = symbol_ids
+        records['lot_size'] = lot_size
+        records['no_of_lots'] = no_of_lots
+        records['buy_value'] = buy_value
+        records['sell_value'] = sell_value
+        records.tofile(self._file)
+        self.rows += len(records)
+
+    def close(self):
+        symbols_offset = self._file.tell()
+        table = "".join(f"{symbol}\n" for symbol in self.symbols).encode('utf-8')
+        self._file.write(table)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(TRADE_MAGIC, trade_dtype().itemsize, 0, self.rows, symbols_offset,
+                                     len(table)))
+        self._file.close()
+
+
+def map_records(path, dtype, start, count, mode='r'):
+    """numpy.memmap of records start to start + count of a trade or result file"""
+    import numpy as np
+
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, offset=HEADER.size + start * dtype.itemsize, shape=(count,))
+
+
+def trade_file_info(path):
+    """(number of trades, list of symbols) of a trade file"""
+    record_size, rows, symbols_offset, symbols_length = read_header(path, TRADE_MAGIC)
+    if record_size != trade_dtype().itemsize:
+        raise ValueError(f"{path} has {record_size}-byte records, expected {trade_dtype().itemsize}")
+    with open(path, 'rb') as f:
+        f.seek(symbols_offset)
+        symbols = f.read(symbols_length).decode('utf-8').splitlines()
+    return rows, symbols
+
+
+def open_trades(path):
+    """(read-only memmap of all trade records, list of symbols) of a trade file"""
+    rows, symbols = trade_file_info(path)
+    return map_records(path, trade_dtype(), 0, rows), symbols
+
+
+def create_results(path, rows):
+    """Create a result file for rows trades; its records are zero until computed"""
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(RESULT_MAGIC, result_dtype().itemsize, 0, rows, 0, 0))
+        f.truncate(HEADER.size + rows * result_dtype().itemsize)
+
+
+def open_results(path):
+    """Read-only memmap of all records of a result file"""
+    record_size, rows, _, _ = read_header(path, RESULT_MAGIC)
+    if record_size != result_dtype().itemsize:
+        raise ValueError(f"{path} has {record_size}-byte records, expected {result_dtype().itemsize}")
+    return map_records(path, result_dtype(), 0, rows)
+
+
+def compute_trade_file(trade_path, result_path, schedule, chunk_rows=CHUNK_ROWS, progress=None):
+    """
+    Compute every trade of a trade file into a new result file, chunk by chunk. progress(done, total) is
+    called after each chunk. Returns the number of trades.
+    """
+    import numpy as np
+    from charge_kernels import compute_charges_jit
+
+    rows, _ = trade_file_info(trade_path)
+    create_results(result_path, rows)
+    for start in range(0, rows, chunk_rows):
+        count = min(chunk_rows, rows - start)
+        # Each chunk is mapped on its own and unmapped after it, so only one chunk of either file is resident
+        # in the process; the data stays in the page cache, and dirty result pages are written back by the kernel
+        chunk = map_records(trade_path, trade_dtype(), start, count)
+        out = map_records(result_path, result_dtype(), start, count, mode='r+')
+        total_lot_size = chunk['lot_size'].astype(np.int64) * chunk['no_of_lots']
+        charges = compute_charges_jit(schedule, total_lot_size, chunk['buy_value'], chunk['sell_value'])
+        out['sl_no'] = chunk['sl_no']
+        for field in RESULT_FIELDS:
+            out[field] = charges[field]
+        del chunk, out, charges
+        if progress:
+            progress(start + count, rows)
+    return rows
+
+
+def convert_input(input_file, trade_path):
+    """
+    Write the valid rows of an input workbook or CSV to a trade file; returns the number of trades. Rows failing
+    the input validation are written to a rejected-rows file, as in the workbook pipeline.
+    """
+    from brokerage_calculator import read_input, validate_rows
+
+    df = validate_rows(read_input(input_file), input_file)
+    writer = TradeFileWriter(trade_path)
+    try:
+        symbol_ids = [writer.symbol_id(symbol) for symbol in df['SYMBOL']]
+        writer.write(df['SL_N0'].to_numpy(), symbol_ids, df['LOT_SIZE'].to_numpy(), df['NO_OF_LOTS'].to_numpy(),
+                     df['BUY_VALUE'].to_numpy(), df['SELL_VALUE'].to_numpy())
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def generate_trades(trade_path, rows, symbols=("NIFTY", "BANKNIFTY", "FINNIFTY"), chunk_rows=CHUNK_ROWS, seed=0):
+    """Write rows synthetic trades with random lots and premiums, chunk by chunk"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    writer = TradeFileWriter(trade_path)
+    try:
+        symbol_ids = np.array([writer.symbol_id(symbol) for symbol in symbols])
+        for start in range(0, rows, chunk_rows):
+            count = min(chunk_rows, rows - start)
+            sell_value = np.round(rng.uniform(0.05, 1000, count), 2)
+            sell_value[rng.random(count) < 0.1] = 0.0  # open positions
+            writer.write(np.arange(start + 1, start + count + 1), rng.choice(symbol_ids, count),
+                         rng.choice([15, 25, 40, 50, 75], count), rng.integers(1, 20, count),
+                         np.round(rng.uniform(0.05, 1000, count), 2), sell_value)
+    finally:
+        writer.close()
+    return writer.rows
+
+
+if __name__ == "__main__":
+    from fee_schedule import SEGMENTS
+
+    parser = argparse.ArgumentParser(description="Fixed-width binary trade files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="write synthetic trades")
+    generate.add_argument("rows", type=int)
+    generate.add_argument("trade_file")
+    convert = commands.add_parser("convert", help="convert an input workbook or CSV")
+    convert.add_argument("input_file")
+    convert.add_argument("trade_file")
+    compute = commands.add_parser("compute", help="compute a trade file into a result file")
+    compute.add_argument("trade_file")
+    compute.add_argument("result_file")
+    compute.add_argument("--segment", choices=SEGMENTS, default="options")
+    compute.add_argument("--mode", choices=("local", "calibrated"), default="local")
+    compute.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    head = commands.add_parser("head", help="print the first rows of a trade or result file")
+    head.add_argument("path")
+    head.add_argument("--rows", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        print(f"Wrote {generate_trades(args.trade_file, args.rows)} trades to {args.trade_file}")
+    elif args.command == "convert":
+        print(f"Wrote {convert_input(args.input_file, args.trade_file)} trades to {args.trade_file}")
+    elif args.command == "compute":
+        import time
+        from brokerage_calculator import BrokerageCalculator
+
+        def report_progress(done, total_rows):
+            print(f"Processing: {done / total_rows * 100:.1f}%", end="\r")
+
+        started = time.perf_counter()
+        schedule = BrokerageCalculator(args.segment, args.mode).schedule
+        rows = compute_trade_file(args.trade_file, args.result_file, schedule, args.chunk_rows, report_progress)
+        elapsed = time.perf_counter() - started
+        print(f"\nComputed {rows} trades in {elapsed:.1f}s ({rows / elapsed / 1e6 if elapsed else 0:.1f}M trades/s) "
+              f"into {args.result_file}")
+    else:
+        import pandas as pd
+
+        with open(args.path, 'rb') as f:
+            magic = f.read(8)
+        if magic == TRADE_MAGIC:
+            trades, symbols = open_trades(args.path)
+            df = pd.DataFrame(trades[:args.rows]).drop(columns='reserved')
+            df.insert(1, 'SYMBOL', [symbols[symbol_id] for symbol_id in df.pop('symbol_id')])
+        else:
+            df = pd.DataFrame(open_results(args.path)[:args.rows])
+        print(df.to_string(index=False))
@@ -0,0 +1,132 @@
+"""
+Array-backed trade records for the row-wise pipeline.
+
+TradeTable converts the input columns once (vectorized) into a NumPy structured array of 40 bytes per trade,
+so the hot loop reads plain tuples instead of doing label lookups and conversions on pandas Series.
+ResultColumns collects each row's charges straight into preallocated column arrays by position.
+"""
+
+# Numeric fields of a trade; the first four are the calculate() arguments
+TRADE_FIELDS = [('lot_size', 'i8'), ('total_lot_size', 'i8'), ('buy_value', 'f8'), ('sell_value', 'f8'),
+                ('no_of_lots', 'i8')]
+
+
+class TradeTable:
+    """The trades of one input DataFrame, sorted by SL_N0"""
+
+    __slots__ = ('records', 'valid', 'errors', 'index', 'sl_no', 'symbols', 'no_of_lots', 'total_lot_size')
+
+    def __init__(self, df):
+        import numpy as np
+        import pandas as pd
+
+        df = df.sort_values('SL_N0', kind='stable')
+        numbers = {column: pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+                   for column in ('LOT_SIZE', 'NO_OF_LOTS', 'BUY_VALUE', 'SELL_VALUE')}
+        self.valid = np.ones(len(df), dtype=bool)
+        for values in numbers.values():
+            self.valid &= np.isfinite(values)
+        # Reason for each row that cannot be computed, reported like a failed calculation
+        self.errors = {}
+        for position in np.flatnonzero(~self.valid).tolist():
+            bad = [column for column, values in numbers.items() if not np.isfinite(values[position])]
+            self.errors[position] = f"invalid {', '.join(bad)}"
+
+        lot_size = np.where(self.valid, numbers['LOT_SIZE'], 0).astype('i8')
+        no_of_lots = np.where(self.valid, numbers['NO_OF_LOTS'], 0).astype('i8')
+        self.records = np.empty(len(df), dtype=TRADE_FIELDS)
+        self.records['lot_size'] = lot_size
+        self.records['total_lot_size'] = lot_size * no_of_lots
+        self.records['buy_value'] = numbers['BUY_VALUE']
+        self.records['sell_value'] = numbers['SELL_VALUE']
+        self.records['no_of_lots'] = no_of_lots
+
+        # Row labels for error messages; the rest is passed through to the report unchanged
+        self.index = df.index.to_numpy()
+        self.sl_no = df['SL_N0'].to_numpy()
+        self.symbols = df['SYMBOL'].to_numpy()
+        self.no_of_lots = df['NO_OF_LOTS'].to_numpy()
+        self.total_lot_size = df['TOTAL_LOT_SIZE'].to_numpy()
+
+    def __len__(self):
+        return len(self.records)
+
+    def call_args(self, position):
+        """(lot_size, total_lot_size, buy_value, sell_value) of a row as Python numbers"""
+        return self.records[position].item()[:4]
+
+    def call_key(self, position):
+        """
+        (total_lot_size, buy_value, sell_value): what the charges depend on, since the calculator is only given
+        the total quantity. Rows with the same key (e.g. 20 x 2 lots and 40 x 1 lot) share one calculation.
+        """
+        return self.records[position].item()[1:4]
+
+    def result_row(self, position, calculated_values):
+        """The report row of one trade as a dict (for streamed output)"""
+        lot_size, total_lot_size, buy_value, sell_value, no_of_lots = self.records[position].item()
+        result_row = {
+            'SL_N0': self.sl_no[position],
+            'SYMBOLS': self.symbols[position],
+            'LOT_SIZE': lot_size,
+            "PREMUIM_VALUE": buy_value + sell_value,
+            'NO_OF_LOTS': self.no_of_lots[position],
+            'TOTAL_LOT_SIZE': self.total_lot_size[position],
+            'TOTAL_PREMIUM_VALUE': (buy_value + sell_value) * no_of_lots * lot_size,
+        }
+        for key, value in calculated_values.items():
+            result_row[key] = report_value(value)
+        return result_row
+
+
+def report_value(value):
+    """Scraped amounts arrive as strings; plain decimals become floats, anything else (e.g. "1,234.00") is kept"""
+    if isinstance(value, str) and value.replace(".", "", 1).isdigit():
+        return float(value)
+    return value
+
+
+class ResultColumns:
+    """Charges of a TradeTable's rows, written by position into preallocated arrays"""
+
+    __slots__ = ('table', 'done', 'columns')
+
+    def __init__(self, table):
+        import numpy as np
+
+        self.table = table
+        self.done = np.zeros(len(table), dtype=bool)
+        self.columns = None
+
+    def set(self, position, calculated_values):
+        import numpy as np
+
+        if self.columns is None:
+            self.columns = {key: np.full(len(self.table), np.nan) for key in calculated_values}
+        for key, value in calculated_values.items():
+            value = report_value(value)
+            column = self.columns[key]
+            if column.dtype != object and not isinstance(value, float):
+                # A value that is not a plain number (e.g. "1,234.00") turns the column into an object column
+                column = self.columns[key] = column.astype(object)
+            column[position] = value
+        self.done[position] = True
+
+    def to_frame(self):
+        """The report rows that were computed, as a DataFrame in SL_N0 order"""
+        import pandas as pd
+
+        records = self.table.records[self.done]
+        premium = records['buy_value'] + records['sell_value']
+        results_df = pd.DataFrame({
+            'SL_N0': self.table.sl_no[self.done],
+            'SYMBOLS': self.table.symbols[self.done],
+            'LOT_SIZE': records['lot_size'],
+            "PREMUIM_VALUE": premium,
+            'NO_OF_LOTS': self.table.no_of_lots[self.done],
+            'TOTAL_LOT_SIZE': self.table.total_lot_size[self.done],
+            'TOTAL_PREMIUM_VALUE': premium * records['no_of_lots'] * records['lot_size'],
+        })
+        for key, values in (self.columns or {}).items():
+            results_df[key] = values[self.done]
+        return results_df
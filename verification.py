@@ -0,0 +1,125 @@
+import random
+
+import pandas as pd
+
+from concurrency import AdaptiveConcurrencyController, run_adaptive
+from fee_schedule import clean_value
+from scrape_fixtures import FixtureMiss
+
+VERIFIED_COLUMNS = ['BROKERAGE', 'STT_TOTAL', 'EXCHANGE_TXN_Charge', 'GST', 'SEBI_CHARGES', 'STAMP DUTY',
+                    'TOTAL TAX AND CHARGES']
+
+
+def turnover(df):
+    return (df['BUY_VALUE'] + df['SELL_VALUE']) * df['LOT_SIZE'] * df['NO_OF_LOTS']
+
+
+def select_sample(df, sample_size=20, strategy="stratified", buckets=4, seed=None):
+    """
+    Pick the row labels to scrape.
+    "random" draws uniformly; "stratified" splits rows by SEGMENT (when the column exists) and turnover
+    quantile bucket and draws from every stratum in proportion to its size, at least one row each.
+    """
+    rng = random.Random(seed)
+    labels = list(df.index)
+    if sample_size >= len(labels):
+        return labels
+    if strategy == "random":
+        return sorted(rng.sample(labels, sample_size))
+
+    keys = [pd.qcut(turnover(df), q=min(buckets, len(df)), labels=False, duplicates='drop')]
+    if 'SEGMENT' in df.columns:
+        keys.insert(0, df['SEGMENT'])
+    sample = []
+    for _, stratum in df.groupby(keys, sort=True):
+        share = max(1, round(sample_size * len(stratum) / len(df)))
+        sample.extend(rng.sample(list(stratum.index), min(share, len(stratum))))
+
+    # Per-stratum rounding can leave the sample a few rows off the requested size
+    if len(sample) > sample_size:
+        sample = rng.sample(sample, sample_size)
+    elif len(sample) < sample_size:
+        chosen = set(sample)
+        sample.extend(rng.sample([label for label in labels if label not in chosen], sample_size - len(sample)))
+    return sorted(sample)
+
+
+def verify_results(df, results_df, scrape, sample_size=20, strategy="stratified", tolerance=0.01, seed=None,
+                   controller=None):
+    """
+    Scrape a sample of the input rows with scrape (the script's calculate_brokerage) and compare them with the
+    locally computed results_df. Adds VERIFY_STATUS and VERIFY_MAX_DIFF columns to results_df (matched on SL_N0)
+    and returns (results_df, stats).
+    """
+    sample = select_sample(df, sample_size, strategy, seed=seed)
+    print(f"Verifying {len(sample)} of {len(df)} rows against the calculator ({strategy} sample)")
+
+    def scrape_row(row_data):
+        lot_size = int(row_data['LOT_SIZE'])
+        total_lot_size = lot_size * int(row_data['NO_OF_LOTS'])
+        return scrape(lot_size, total_lot_size, float(row_data['BUY_VALUE']), float(row_data['SELL_VALUE']))
+
+    scraped = {}
+
+    def on_result(label, future):
+        try:
+            scraped[label] = future.result()
+        except FixtureMiss:
+            # Replay mode must not silently drop samples that were never recorded
+            raise
+        except Exception as exc:
+            print(f"Verification scrape for row {label} generated an exception: {exc}")
+
+    run_adaptive(scrape_row, ((label, df.loc[label]) for label in sample),
+                 controller or AdaptiveConcurrencyController(), on_result)
+
+    results_df = results_df.copy()
+    results_df['VERIFY_STATUS'] = 'not sampled'
+    results_df['VERIFY_MAX_DIFF'] = None
+    positions = {sl_no: position for position, sl_no in enumerate(results_df['SL_N0'])}
+
+    differences = []
+    mismatched_columns = {column: 0 for column in VERIFIED_COLUMNS}
+    failed = 0
+    for label in sample:
+        position = positions.get(df.loc[label, 'SL_N0'])
+        if position is None:
+            continue
+        values = scraped.get(label)
+        if not values:
+            failed += 1
+            results_df.iloc[position, results_df.columns.get_loc('VERIFY_STATUS')] = 'scrape failed'
+            continue
+
+        local_row = results_df.iloc[position]
+        row_differences = {column: abs(clean_value(values[column]) - clean_value(local_row[column]))
+                           for column in VERIFIED_COLUMNS}
+        max_difference = max(row_differences.values())
+        for column, difference in row_differences.items():
+            if difference > tolerance + 1e-9:
+                mismatched_columns[column] += 1
+        differences.append(row_differences['TOTAL TAX AND CHARGES'])
+
+        status = 'mismatch' if max_difference > tolerance + 1e-9 else 'match'
+        results_df.iloc[position, results_df.columns.get_loc('VERIFY_STATUS')] = status
+        results_df.iloc[position, results_df.columns.get_loc('VERIFY_MAX_DIFF')] = round(max_difference, 2)
+
+    mismatches = int((results_df['VERIFY_STATUS'] == 'mismatch').sum())
+    stats = {
+        'rows': len(df),
+        'sampled': len(sample),
+        'compared': len(differences),
+        'scrape_failures': failed,
+        'mismatches': mismatches,
+        'mismatch_rate': mismatches / len(differences) if differences else None,
+        'mean_total_diff': sum(differences) / len(differences) if differences else None,
+        'max_total_diff': max(differences) if differences else None,
+        'mismatched_columns': {column: count for column, count in mismatched_columns.items() if count},
+    }
+
+    print(f"Verification: {stats['compared']} compared, {mismatches} mismatched, {failed} scrape failures")
+    if differences:
+        print(f"Total charges difference: mean {stats['mean_total_diff']:.4f}, max {stats['max_total_diff']:.2f}")
+    for column, count in stats['mismatched_columns'].items():
+        print(f"  {column}: {count} mismatched rows")
+    return results_df, stats
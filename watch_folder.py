@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Watch-folder daemon: processes every *_input.xlsx/.xls/.csv file dropped into the watched directories.
+
+A file is picked up once it is completely written (inotify close-after-write or rename into the directory on
+Linux; elsewhere, or when inotify is unavailable, when its size and modification time stop changing between
+polls). Files are processed on a shared pool of --workers threads and then moved to done/ or failed/ next to
+where they were dropped; each gets its own OUTPUT/{input name}_parameter.xlsx, so concurrent files for one
+symbol do not overwrite each other's. A file rewritten while it is being processed is processed again
+afterwards. Files already present at start-up are processed too.
+
+    python watch_folder.py DROP_DIR [DROP_DIR ...] --segment options --mode local --workers 2
+"""
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from brokerage_calculator import CALCULATION_MODES, base_dir, is_input_file, process_input_file, unique_path
+from fee_schedule import SEGMENTS
+
+# inotify event bits (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+DONE_DIR = "done"
+FAILED_DIR = "failed"
+
+
+class InotifyWatcher:
+    """Reports files closed after writing or renamed into the watched directories (Linux only)"""
+
+    def __init__(self, directories):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}
+        for directory in directories:
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self._directories[wd] = directory
+
+    def poll(self, timeout):
+        """Paths that finished arriving within timeout seconds; None if events were lost and a rescan is due"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name and wd in self._directories:
+                paths.append(os.path.join(self._directories[wd], os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Portable fallback: a file is ready once its size and mtime are unchanged between two polls"""
+
+    def __init__(self, directories, interval=1.0):
+        self.directories = directories
+        self.interval = interval
+        self._last_seen = {}
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        ready = []
+        seen = {}
+        for path in scan(self.directories):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            seen[path] = (stat.st_size, stat.st_mtime_ns)
+            if self._last_seen.get(path) == seen[path]:
+                ready.append(path)
+        self._last_seen = seen
+        return ready
+
+    def close(self):
+        pass
+
+
+def scan(directories):
+    """Input files currently in the watched directories"""
+    paths = []
+    for directory in directories:
+        for file_name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, file_name)
+            if is_input_file(file_name) and os.path.isfile(path):
+                paths.append(path)
+    return paths
+
+
+def move_to(path, folder_name):
+    """Move a processed file into done/ or failed/ beside it, keeping earlier files of the same name"""
+    target_dir = os.path.join(os.path.dirname(path), folder_name)
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, os.path.basename(path))
+    if os.path.exists(target):
+        base_name, extension = os.path.splitext(os.path.basename(path))
+        target = os.path.join(target_dir, f"{base_name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{extension}")
+    os.replace(path, target)
+    return target
+
+
+class WatchFolderDaemon:
+    def __init__(self, directories, segment="options", mode="scrape", workers=2, poll_interval=1.0,
+                 use_inotify=True, incremental=False):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.segment = segment
+        self.mode = mode
+        self.incremental = incremental
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="watch-worker")
+        self.processed = 0
+        self.failed = 0
+        self._in_flight = set()
+        # In-flight files that changed again while being processed
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self.watcher = None
+        if use_inotify:
+            try:
+                self.watcher = InotifyWatcher(self.directories)
+                print(f"Watching {', '.join(self.directories)} with inotify")
+            except (OSError, AttributeError) as exc:
+                print(f"inotify unavailable ({exc}), polling every {poll_interval}s")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(self.directories, poll_interval)
+            if not use_inotify:
+                print(f"Watching {', '.join(self.directories)} by polling every {poll_interval}s")
+
+    def submit(self, path):
+        if not is_input_file(os.path.basename(path)) or not os.path.isfile(path):
+            return
+        with self._lock:
+            if path in self._in_flight:
+                self._dirty.add(path)
+                return
+            self._in_flight.add(path)
+        self.pool.submit(self._process, path)
+
+    @staticmethod
+    def _changed(path, stat):
+        """Whether a file was rewritten since stat was taken, so its result is stale"""
+        try:
+            current = os.stat(path)
+        except OSError:
+            return False
+        return (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns)
+
+    def _process(self, path):
+        started = time.perf_counter()
+        stat = parameter_output = None
+        try:
+            stat = os.stat(path)
+            output_dir = os.path.join(base_dir(), "OUTPUT")
+            os.makedirs(output_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            parameter_output = unique_path(output_dir, f"{stem}_parameter", ".xlsx")
+            output_file, _ = process_input_file(path, self.segment, self.mode, incremental=self.incremental,
+                                                parameter_output=parameter_output)
+            if self._changed(path, stat):
+                # Leave the new content in place to be processed again
+                print(f"{os.path.basename(path)} changed while it was processed, processing it again")
+                return
+            target = move_to(path, DONE_DIR)
+            with self._lock:
+                self.processed += 1
+            print(f"Processed {os.path.basename(path)} in {time.perf_counter() - started:.1f}s -> {output_file} "
+                  f"(input moved to {target})")
+        except Exception as exc:
+            with self._lock:
+                self.failed += 1
+            print(f"Failed to process {path}: {exc}")
+            # unique_path reserved the parameter file name with an empty file; nothing was written to it
+            if parameter_output and os.path.isfile(parameter_output) and os.path.getsize(parameter_output) == 0:
+                os.remove(parameter_output)
+            if os.path.exists(path) and not (stat and self._changed(path, stat)):
+                move_to(path, FAILED_DIR)
+        finally:
+            with self._lock:
+                self._in_flight.discard(path)
+                dirty = path in self._dirty
+                self._dirty.discard(path)
+            # A file still in place after its run was changed meanwhile; the polling watcher also reports
+            # unchanged files during a run, but those have been moved to done/ or failed/ by now
+            if dirty and os.path.isfile(path):
+                self.submit(path)
+
+    def run(self, timeout=0.5):
+        """Process files until stop() is called"""
+        # Files dropped while the daemon was not running; recently modified ones may still be being written and
+        # are left to the watcher
+        for path in scan(self.directories):
+            if time.time() - os.path.getmtime(path) >= 1.0:
+                self.submit(path)
+        while not self._stop.is_set():
+            paths = self.watcher.poll(timeout)
+            if paths is None:
+                print("inotify queue overflowed, rescanning")
+                paths = scan(self.directories)
+            for path in paths:
+                self.submit(path)
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.watcher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process *_input files as they are dropped into directories")
+    parser.add_argument("directories", nargs="+")
+    parser.add_argument("--segment", choices=SEGMENTS, default="options")
+    parser.add_argument("--mode", choices=CALCULATION_MODES, default=os.environ.get("BROKERAGE_MODE", "scrape"))
+    parser.add_argument("--workers", type=int, default=2, help="files processed concurrently")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--no-inotify", action="store_true", help="always poll")
+    parser.add_argument("--incremental", action="store_true")
+    args = parser.parse_args()
+
+    daemon = WatchFolderDaemon(args.directories, args.segment, args.mode, args.workers, args.poll_interval,
+                               not args.no_inotify, args.incremental)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+        print(f"Processed {daemon.processed} files, {daemon.failed} failed")